@@ -4,8 +4,6 @@ from googleapiclient.discovery import build
 from google.oauth2 import service_account
 from dotenv import load_dotenv
 
-load_dotenv('creds/.env')
-
 def create_gsuite_user(email_admin, email_address, first_name, last_name):
     # Set up credentials and create the service
     SCOPES = ['https://www.googleapis.com/auth/admin.directory.user']
@@ -49,6 +47,8 @@ def create_gsuite_user(email_admin, email_address, first_name, last_name):
         return None
 
 if __name__ == "__main__":
+    load_dotenv('creds/.env')
+
     # load json from agents/agent.json
     with open("agents/agent.json") as f:
         agent_data = json.load(f)
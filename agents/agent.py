@@ -1,13 +1,15 @@
 import os
-import time
 import json
+import threading
 
-from openai import OpenAI
-from dotenv import load_dotenv
 from typing import List, Dict, Protocol, Union
 from utils.classes import File, Message
-
-load_dotenv('creds/.env', override=True)
+from utils.uploads import upload_files
+from utils.runs import stream_run
+from utils.assistants import assistant_registry
+from utils.clients import openai_client
+from utils.budget import HistoryBudget
+from utils.sessions import MemorySessionStore
 
 
 class MessageHandler(Protocol):
@@ -15,8 +17,8 @@ class MessageHandler(Protocol):
         pass
 
 class Agent(MessageHandler):
-    def __init__(self, name, instructions, model="gpt-4o-mini", force=False):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    def __init__(self, name, instructions, model="gpt-4o-mini", force=False, session_lock_stripes=64):
+        self.client = openai_client()
 
         # Create or load assistant
         self.assistant = self.create_assistant(name, instructions, model=model, force=force)
@@ -24,35 +26,36 @@ class Agent(MessageHandler):
         self.name = name
         self.instructions = instructions
 
-        # Track threads per user
-        self.thread_id = None
+        # Track a thread per session (e.g. per user of the EmployeeOS), rolling over to a summary
+        # once the thread outgrows the token budget
+        self.threads = MemorySessionStore()
+        self.history = HistoryBudget(self.client, model=model)
+
+        # Runs on a thread are sequential, so each session's callers take turns while
+        # different sessions run concurrently
+        self.session_locks = [threading.Lock() for _ in range(session_lock_stripes)]
 
     def create_assistant(self, name, instructions, model="gpt-4o-mini", force=False):
-        # if not force:
-        #     assistants = self.client.beta.assistants.list(limit=100).data
-        #     for assistant in assistants:
-        #         if assistant.name == name:
-        #             return assistant
-
-        return self.client.beta.assistants.create(
-            name=name,
-            instructions=instructions,
-            tools=[{"type": "code_interpreter"}],
-            model=model
-        )
+        """Reuse the assistant registered under this name, or create it. `force` always creates a new one"""
+        config = {
+            "instructions": instructions,
+            "tools": [{"type": "code_interpreter"}],
+            "model": model
+        }
+
+        if force:
+            assistant = self.client.beta.assistants.create(name=name, **config)
+            assistant_registry.register(name, assistant.id, config)
+            return assistant
+
+        return assistant_registry.get_or_create(self.client, name, **config)
 
     def add_files(self, files: List[Union[File, str]]) -> List[str]:
         """Upload files to the assistant"""
 
         # If files are File objects, upload them
         if isinstance(files[0], File):
-            file_ids = []
-            for file in files:
-                uploaded_file = self.client.files.create(
-                    file=file.content,
-                    purpose='assistants'
-                )
-                file_ids.append(uploaded_file.id)
+            file_ids = upload_files(self.client, files)
 
         else:
             # Assume files are already uploaded
@@ -126,7 +129,16 @@ class Agent(MessageHandler):
                 elif content.type == 'image_file':
                     print(f"{color}{role}: Attachment: {content.image_file.file_id}{RESET}")
 
-    def handle_message(self, message: Message) -> tuple[str, List]:
+    def session_lock(self, session) -> threading.Lock:
+        return self.session_locks[hash(session) % len(self.session_locks)]
+
+    def handle_message(self, message: Message, session=None) -> tuple[str, List]:
+        """Respond to a message on the thread of `session`, which defaults to a single shared thread"""
+        session = session or self.name
+        with self.session_lock(session):
+            return self._handle_message(message, session)
+
+    def _handle_message(self, message: Message, session) -> tuple[str, List]:
         content = message.text
 
         print(f'{self.name} received message: "{content}"')
@@ -136,66 +148,63 @@ class Agent(MessageHandler):
             # if message.files:
             #     self.add_files(message.files)
 
+            thread_id = self.threads.get(session)
+            if thread_id is not None and self.history.over_budget(session):
+                thread_id = self.history.roll_over_thread(session, thread_id)
+                self.threads.set(session, thread_id)
+
             # Create thread with just the text message
-            if self.thread_id is None:
+            if thread_id is None:
                 thread = self.client.beta.threads.create(
                     messages=[{"role": "user", "content": content}]
                 )
-                self.thread_id = thread.id
+                thread_id = thread.id
+                self.threads.set(session, thread_id)
             else:
                 # Add message to existing thread
                 self.client.beta.threads.messages.create(
-                    thread_id=self.thread_id,
+                    thread_id=thread_id,
                     role="user",
                     content=content
                 )
 
-            # Run the assistant
-            run = self.client.beta.threads.runs.create(
-                thread_id=self.thread_id,
-                assistant_id=self.assistant.id
-            )
-
-            # Wait for completion
-            while True:
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=self.thread_id,
-                    run_id=run.id
-                )
-
-                status = run.status
-                print(f"Run status for {self.name}: {status}")
+            # Stream the run until it reaches a terminal state
+            run = stream_run(self.client, thread_id, self.assistant.id, name=self.name)
 
-                if status == 'completed':
-                    break
-                elif status == 'incomplete':
-                    return f"Sorry, I encountered an error processing your request:\n{run.incomplete_details}"
-                elif status == 'failed':
-                    return f"Sorry, I encountered an error processing your request:\n{run.error}"
+            status = run.status
+            if status == 'incomplete':
+                return f"Sorry, I encountered an error processing your request:\n{run.incomplete_details}", []
+            elif status == 'failed':
+                return f"Sorry, I encountered an error processing your request:\n{run.error}", []
+            elif status != 'completed':
+                return f"Sorry, I encountered an error processing your request:\nRun ended with status {status}", []
 
-                time.sleep(1)
-
-            # Get messages (newest first)
+            # Get the messages this run added
             messages = self.client.beta.threads.messages.list(
-                thread_id=self.thread_id,
-                order="desc"
+                thread_id=thread_id,
+                order="asc",
+                run_id=run.id
             )
 
             self.print_messages(messages)
             response_text, attachments = self.parse_messages(messages)
+            self.history.add(session, content, response_text)
 
             # return "I had trouble reading the CSV file, can you resent?", []
             return response_text, attachments
 
         except Exception as e:
             print(f"Error in {self.name} assistant response: {e}")
-            return f"Sorry, I encountered an error: {str(e)}"
-
-    def reset_conversation(self, user_id: str):
-        """Start a new thread for the user"""
-        # Create new thread
-        thread = self.client.beta.threads.create()
-        self.thread_id = thread.id
+            return f"Sorry, I encountered an error: {str(e)}", []
+
+    def reset_conversation(self, user_id: str = None):
+        """Start a new thread for the user's session"""
+        session = user_id or self.name
+        with self.session_lock(session):
+            # Create new thread
+            thread = self.client.beta.threads.create()
+            self.threads.set(session, thread.id)
+            self.history.reset(session)
 
 
 if __name__ == "__main__":
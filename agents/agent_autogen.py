@@ -3,14 +3,13 @@ import time
 import json
 import regex as re
 
-from openai import OpenAI
-from dotenv import load_dotenv
 from typing import List, Dict, Protocol, Union
 from utils.classes import File, Message
+from utils.uploads import upload_files
+from utils.assistants import assistant_registry, merge_file_ids
+from utils.clients import load_env, openai_client
 from autogen.agentchat.contrib.gpt_assistant_agent import GPTAssistantAgent
 
-load_dotenv('creds/.env', override=True)
-assistant_id = os.environ.get("ASSISTANT_ID", None)
 
 
 class MessageHandler(Protocol):
@@ -19,14 +18,25 @@ class MessageHandler(Protocol):
 
 class Agent(GPTAssistantAgent):
     def __init__(self, name, instructions, model="gpt-4o-mini"):
+        load_env()
+        assistant_id = os.environ.get("ASSISTANT_ID", None)
+
         llm_config = {
             "model": model,
             "api_key": os.getenv('OPENAI_API_KEY')
         }
 
+        tools = [{"type": "code_interpreter"}]
+
+        # Reuse the registered assistant, updating it in place if its config changed
+        config = {"instructions": instructions, "tools": tools, "model": model}
+        registered_id, changed = assistant_registry.lookup_existing(openai_client(), name, config)
+
         assistant_config = {
-            "assistant_id": assistant_id,
-            "tools": [{"type": "code_interpreter"}]
+            "assistant_id": assistant_id or registered_id,
+            "tools": tools,
+            "overwrite_instructions": changed,
+            "overwrite_tools": changed
         }
 
         super().__init__(
@@ -36,18 +46,21 @@ class Agent(GPTAssistantAgent):
             assistant_config=assistant_config,
             verbose=True,)
 
+        # Use the shared pooled, rate limited client instead of the one autogen builds
+        self._openai_client = openai_client()
+
+        # autogen only overwrites instructions and tools of an existing assistant
+        if changed and assistant_config["assistant_id"]:
+            self._openai_assistant = self.openai_client.beta.assistants.update(self.assistant_id, model=model)
+
+        assistant_registry.register(name, self.assistant_id, config)
+
     def add_files(self, files: List[Union[File, str]]) -> List[str]:
         """Upload files to the assistant"""
 
         # If files are File objects, upload them
         if isinstance(files[0], File):
-            file_ids = []
-            for file in files:
-                uploaded_file = self.openai_client.files.create(
-                    file=file.content,
-                    purpose='assistants'
-                )
-                file_ids.append(uploaded_file.id)
+            file_ids = upload_files(self.openai_client, files)
 
         else:
             # Assume files are already uploaded
@@ -59,7 +72,7 @@ class Agent(GPTAssistantAgent):
             tools=self.openai_assistant.tools,
             tool_resources={
                 "code_interpreter": {
-                    "file_ids": file_ids
+                    "file_ids": merge_file_ids([], file_ids)
                 }
             })
 
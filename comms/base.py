@@ -1,3 +1,9 @@
+import asyncio
+import inspect
+
+from abc import ABC, abstractmethod
+
+from concurrent.futures import ThreadPoolExecutor
 from typing import Protocol
 from utils.classes import Message
 
@@ -6,6 +12,11 @@ class MessageHandler(Protocol):
     def handle_message(self, message: Message) -> str:
         pass
 
+class AsyncMessageHandler(Protocol):
+    name: str
+    async def handle_message(self, message: Message) -> str:
+        pass
+
 class CommsBotBase:
     def __init__(self):
         self._message_handler: MessageHandler = None
@@ -24,4 +35,26 @@ class CommsBotBase:
     def message_handler(self, handler: MessageHandler):
         if not hasattr(handler, 'handle_message'):
             raise ValueError("Handler must implement handle_message")
-        self._message_handler = handler
\ No newline at end of file
+        self._message_handler = handler
+
+class AsyncCommsBotBase(CommsBotBase, ABC):
+    """Comms bot that runs as a task on a shared asyncio event loop"""
+
+    async def respond(self, message: Message):
+        """Send a message to the handler without blocking the event loop"""
+        handler = self.message_handler
+        if inspect.iscoroutinefunction(handler.handle_message):
+            return await handler.handle_message(message)
+
+        # Synchronous handlers run on the loop's executor
+        return await asyncio.to_thread(handler.handle_message, message)
+
+    @abstractmethod
+    async def run(self):
+        """Run the bot until cancelled"""
+
+async def run_bots(*bots: AsyncCommsBotBase, max_workers=64):
+    """Host several bots on a single event loop"""
+    # Size the default executor for the synchronous handlers and client calls bots offload to it
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+    await asyncio.gather(*(bot.run() for bot in bots))
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 import os
 import imaplib
@@ -11,15 +12,14 @@ from email.message import EmailMessage
 from email.utils import formataddr, make_msgid
 
 from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-from comms.base import CommsBotBase
+from comms.base import CommsBotBase, AsyncCommsBotBase
 from utils.classes import File, ApplicationMessage
-
-load_dotenv('creds/.env')
+from utils.clients import load_env
 
 class GmailBot(CommsBotBase):
     def __init__(self):
         super().__init__()
+        load_env()
         self.email_queue = queue.Queue()
 
         # load json file
@@ -71,51 +71,56 @@ class GmailBot(CommsBotBase):
         except Exception as e:
             print(f"Error getting unread emails: {e}")
 
+    def parse_email(self, email_message):
+        """Convert an email into an ApplicationMessage. Returns (message, email_id, subject)"""
+        print(f"Processing email with subject: {email_message['subject']}")
+        if email_message.is_multipart():
+            for part in email_message.walk():
+                if part.get_content_type() == "text/html":
+                    body = part.get_payload(decode=True).decode()
+                    break
+
+        else:
+            body = email_message.get_payload(decode=True).decode()
+
+        # Get email attachments
+        files = []
+        for part in email_message.walk():
+            if part.get_content_maintype() == 'multipart':
+                continue
+            if part.get('Content-Disposition') is None:
+                continue
+            filename = part.get_filename()
+            if filename:
+                files.append(File(
+                    name=filename,
+                    content=part.get_payload(decode=True)
+                ))
+
+        sender_email = email.utils.parseaddr(email_message['from'])[1]
+        subject = email_message.get('subject', None)
+        date = email_message.get('date', None)
+        cc_emails = email_message.get('cc', None)
+        email_id = email_message.get('Message-ID', None)
+
+        text = f"Please respond to this email from {sender_email}.\n\nSubject: {subject}\nDate: {date}\n\n{body}"
+
+        message = ApplicationMessage(
+            user=sender_email,
+            text=text,
+            application="Gmail",
+            files=files
+        )
+
+        return message, email_id, subject
+
     def process_emails(self):
         while True:
             # Wait for new email
             email_message = self.email_queue.get()
 
             try:
-                print(f"Processing email with subject: {email_message['subject']}")
-                if email_message.is_multipart():
-                    for part in email_message.walk():
-                        if part.get_content_type() == "text/html":
-                            body = part.get_payload(decode=True).decode()
-                            break
-
-                else:
-                    body = email_message.get_payload(decode=True).decode()
-
-                # Get email attachments
-                files = []
-                for part in email_message.walk():
-                    if part.get_content_maintype() == 'multipart':
-                        continue
-                    if part.get('Content-Disposition') is None:
-                        continue
-                    filename = part.get_filename()
-                    if filename:
-                        files.append(File(
-                            name=filename,
-                            content=part.get_payload(decode=True)
-                        ))
-
-                sender_email = email.utils.parseaddr(email_message['from'])[1]
-                subject = email_message.get('subject', None)
-                date = email_message.get('date', None)
-                cc_emails = email_message.get('cc', None)
-                email_id = email_message.get('Message-ID', None)
-
-                text = f"Please respond to this email from {sender_email}.\n\nSubject: {subject}\nDate: {date}\n\n{body}"
-
-                message = ApplicationMessage(
-                    user=sender_email,
-                    text=text,
-                    application="Gmail",
-                    files=files
-                )
-
+                message, email_id, subject = self.parse_email(email_message)
                 reply_body, files = self._message_handler.handle_message(message)
 
                 # Send response email
@@ -179,6 +184,32 @@ class GmailBot(CommsBotBase):
         while True:
             time.sleep(1)
 
+class AsyncGmailBot(GmailBot, AsyncCommsBotBase):
+    """GmailBot that checks the inbox and replies as tasks on a shared event loop"""
+
+    async def process_email(self, email_message):
+        try:
+            message, email_id, subject = self.parse_email(email_message)
+            reply_body, files = await self.respond(message)
+
+            # Send response email
+            await asyncio.to_thread(self.reply_to_email, email_id, subject, reply_body, attachments=files)
+        except Exception as e:
+            print(f"Error processing email: {e}")
+
+    async def run(self, interval=60):
+        tasks = set()
+        while True:
+            # IMAP is blocking, fetch off the loop
+            await asyncio.to_thread(self.get_unread_emails)
+
+            while not self.email_queue.empty():
+                task = asyncio.create_task(self.process_email(self.email_queue.get_nowait()))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            await asyncio.sleep(interval)
+
 if __name__ == "__main__":
     bot = GmailBot()
     bot.start()
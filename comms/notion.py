@@ -1,42 +1,75 @@
-import dotenv
+import asyncio
 import os
+import json
+import hmac
+import hashlib
 import requests
-import mistune
 from datetime import datetime, timedelta
 import threading
 import queue
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
 
-from notion_client import Client
-from agents.agent import MessageHandler
-from comms.base import CommsBotBase
+
+from comms.base import CommsBotBase, AsyncCommsBotBase
 from utils.classes import ApplicationMessage, File
+from utils.state import load_json, save_json
+from utils.cache import TTLCache
+from utils.clients import load_env, notion_client, http_session
+from utils.dedup import DedupStore, SQLiteDedupStore
+
 
+WATERMARKS_FILE = "notion_watermarks.json"
 
-dotenv.load_dotenv('creds/.env')
+def parse_time(timestamp):
+    """Parse a Notion ISO 8601 timestamp (e.g. 2024-01-01T12:00:00.000Z)"""
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
 
 class NotionBot(CommsBotBase):
-    def __init__(self):
+    def __init__(self, max_workers=8, responders=1, dedup_store: DedupStore = None):
         super().__init__()
-        self.client = Client(auth=os.environ["NOTION_TOKEN"])
+        # Notion allows an average of ~3 requests per second per integration. The shared client
+        # waits on the "notion" service's bucket (RATE_LIMIT_NOTION overrides it) and retries 429s and 5xx
+        self.client = notion_client()
+        self.fetch_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notion-fetch")
+
+        # One responder by default: the autogen EmployeeOS used in main.py keeps per-call state
+        # (attachments, the analyst conversation) that concurrent calls would mix up
         self.comment_queue = queue.Queue()
-        self.processed_comment_ids = set()
+        self.responders = responders
 
-    def get_block_comments(self, block_id):
-        try:
-            comments = self.client.comments.list(block_id=block_id)
-            return comments.get("results", [])
-        except Exception as e:
-            print(f"Error getting comments: {e}")
-            return []
+        # Comments already answered, persisted so restarts don't re-answer old mentions.
+        # Queued or in-progress comments are only tracked in memory, so a restart or a failed
+        # reply leaves them to be picked up again
+        self.processed_comment_ids = dedup_store or SQLiteDedupStore("notion_comments")
+        self.pending_comment_ids = set()
+        self.pending_lock = threading.Lock()
 
-    def get_page_comments(self, page_id):
-        # Get top-level comments
-        top_level_comments = self.get_block_comments(page_id)
+        self.workspace_id = None
+        load_env()
+        self.webhook_secret = os.getenv("NOTION_WEBHOOK_SECRET")
+        self.webhook_events = queue.Queue()
 
-        # Get all blocks in the page
-        all_blocks = []
+        # Per poll cycle page snapshots keyed by (page_id, last_edited_time), and user emails
+        self.page_snapshots: Dict[tuple, Dict] = {}
+        self.user_emails = TTLCache(maxsize=1024, ttl=24 * 60 * 60)
+
+    def get_block_comments(self, block_id):
+        # Errors propagate so a poll knows the page wasn't fully scanned
+        comments = self.client.comments.list(block_id=block_id)
+        return comments.get("results", [])
+
+    def get_page_blocks(self, page_id, last_edited_time=None):
+        """List a page's blocks, reusing this poll cycle's snapshot if the page is unchanged"""
+        key = (page_id, last_edited_time)
+        snapshot = self.page_snapshots.get(key)
+        if snapshot is not None:
+            return snapshot["blocks"]
+
+        blocks = []
         has_more = True
         start_cursor = None
 
@@ -46,15 +79,27 @@ class NotionBot(CommsBotBase):
             else:
                 response = self.client.blocks.children.list(block_id=page_id)
 
-            all_blocks.extend(response["results"])
+            blocks.extend(response["results"])
             has_more = response["has_more"]
             if has_more:
                 start_cursor = response["next_cursor"]
 
-        # Get comments for each block
+        # Without a last_edited_time we cannot tell when the snapshot goes stale
+        if last_edited_time is not None:
+            self.page_snapshots[key] = {"blocks": blocks, "content": None}
+        return blocks
+
+    def get_page_comments(self, page_id, last_edited_time=None):
+        # Get top-level comments
+        top_level_comments = self.get_block_comments(page_id)
+
+        # Get all blocks in the page
+        all_blocks = self.get_page_blocks(page_id, last_edited_time)
+
+        # Get comments for each block, fanned out over the fetch pool
         inline_comments = []
-        for block in all_blocks:
-            block_comments = self.get_block_comments(block["id"])
+        block_ids = [block["id"] for block in all_blocks]
+        for block_comments in self.fetch_pool.map(self.get_block_comments, block_ids):
             if block_comments:
                 inline_comments.extend(block_comments)
 
@@ -78,14 +123,11 @@ class NotionBot(CommsBotBase):
         return all_pages
 
     def get_pages_after(self, date=None):
-        """Retrieve all pages updated after a certain date, or all pages if date is None"""
+        """Retrieve all pages edited at or after a certain date, or all pages if date is None"""
         all_pages = []
         has_more = True
         start_cursor = None
 
-        # Convert the date to ISO 8601 format if provided
-        iso_date = date.isoformat() if date else None
-
         while has_more:
             response = self.client.search(
                 filter={
@@ -99,44 +141,67 @@ class NotionBot(CommsBotBase):
                 start_cursor=start_cursor
             )
 
-            # Filter pages by last_edited_time if a date is provided
+            # Results are newest first, so stop paging at the first page older than the date.
+            # Notion rounds last_edited_time to the minute, so pages at the date itself are kept.
             pages = response.get("results", [])
             for page in pages:
-                last_edited_time = page["last_edited_time"]
-                if not iso_date or last_edited_time > iso_date:
-                    all_pages.append(page)
+                if date and parse_time(page["last_edited_time"]) < date:
+                    return all_pages
+                all_pages.append(page)
 
             has_more = response.get("has_more", False)
             start_cursor = response.get("next_cursor")
 
         return all_pages
 
+    def get_workspace_id(self):
+        """Identify the workspace the integration token belongs to"""
+        if self.workspace_id is None:
+            bot = self.client.users.me().get("bot", {})
+            self.workspace_id = bot.get("workspace_id") or bot.get("workspace_name") or "default"
+        return self.workspace_id
+
+    def get_watermark(self):
+        """last_edited_time of the newest page seen by the previous poll of this workspace"""
+        watermarks = load_json(WATERMARKS_FILE, default={})
+        watermark = watermarks.get(self.get_workspace_id())
+        return parse_time(watermark) if watermark else None
+
+    def set_watermark(self, date):
+        watermarks = load_json(WATERMARKS_FILE, default={})
+        watermarks[self.get_workspace_id()] = date.isoformat()
+        save_json(WATERMARKS_FILE, watermarks)
+
+    def block_content(self, block):
+        """Extract the text content and files of a block payload"""
+        # Initialize an empty string to accumulate content
+        content = ""
+        files = []
+
+        # Extract the content based on block type
+        if block["type"] == "image":
+            image_data = block["image"]
+            if image_data["type"] == "external":
+                url = image_data["external"]["url"]
+            elif image_data["type"] == "file":
+                url = image_data["file"]["url"]
+            content = url
+            file = File(name=url, filetype="image", url=url)
+            files.append(file)
+        else:
+            # TODO: Handle other file types
+            # Catch-all for other block types with rich_text
+            rich_text_key = block.get(block["type"], {}).get("rich_text", [])
+            for rich_text in rich_text_key:
+                content += rich_text["text"]["content"]
+
+        return content, files
+
     def get_block_content(self, block_id):
         """Retrieve the content of a block by its ID"""
         try:
             block = self.client.blocks.retrieve(block_id)
-            # Initialize an empty string to accumulate content
-            content = ""
-            files = []
-
-            # Extract the content based on block type
-            if block["type"] == "image":
-                image_data = block["image"]
-                if image_data["type"] == "external":
-                    url = image_data["external"]["url"]
-                elif image_data["type"] == "file":
-                    url = image_data["file"]["url"]
-                content = url
-                file = File(name=url, filetype="image", url=url)
-                files.append(file)
-            else:
-                # TODO: Handle other file types
-                # Catch-all for other block types with rich_text
-                rich_text_key = block.get(block["type"], {}).get("rich_text", [])
-                for rich_text in rich_text_key:
-                    content += rich_text["text"]["content"]
-
-            return content, files
+            return self.block_content(block)
         except Exception as e:
             print(f"Error retrieving block content: {e}")
             return "Error retrieving content", None
@@ -159,36 +224,48 @@ class NotionBot(CommsBotBase):
             print(f"Error retrieving page title: {e}")
             return "Error retrieving title"
 
-    def get_page_content(self, page_id):
-        """Retrieve the text content of a page by iterating over its blocks"""
+    def get_page_content(self, page_id, last_edited_time=None):
+        """Retrieve the text content of a page from the blocks it lists"""
+        key = (page_id, last_edited_time)
+        blocks = self.get_page_blocks(page_id, last_edited_time)
+
+        snapshot = self.page_snapshots.get(key)
+        if snapshot and snapshot["content"] is not None:
+            return snapshot["content"]
+
         all_text_content = []
         all_images = []
 
-        has_more = True
-        start_cursor = None
-
         title = self.get_page_title(page_id)
 
-        while has_more:
-            response = self.client.blocks.children.list(block_id=page_id, start_cursor=start_cursor)
-            blocks = response.get("results", [])
-            has_more = response.get("has_more", False)
-            start_cursor = response.get("next_cursor")
-
-            for block in blocks:
-                block_id = block["id"]
-                block_content, block_images = self.get_block_content(block_id)
-                all_text_content.append(f"Block ID: {block_id}\nBlock Content: {block_content}")
-                all_images.extend(block_images)
+        # blocks.children.list already returns full block payloads, no need to retrieve each one
+        for block in blocks:
+            block_content, block_images = self.block_content(block)
+            all_text_content.append(f"Block ID: {block['id']}\nBlock Content: {block_content}")
+            all_images.extend(block_images)
 
         text_content = "Title: " + title + "\n\n".join(all_text_content)
+
+        if snapshot:
+            snapshot["content"] = (text_content, all_images)
         return text_content, all_images
 
+    def get_user_email(self, user_id):
+        return self.user_emails.get_or_load(
+            user_id,
+            lambda: self.client.users.retrieve(user_id)['person']['email']
+        )
+
     def get_page_comments_for_agent(self, page):
+        comments = self.get_page_comments(page['id'], page.get('last_edited_time'))
+        return self.comments_for_agent(page, comments)
+
+    def comments_for_agent(self, page, comments):
+        """Select the comments on a page that mention the agent and gather their context"""
         page_id = page['id']
         page_url = page['url']
+        last_edited_time = page.get('last_edited_time')
 
-        comments = self.get_page_comments(page_id)
         agent_name = self.message_handler.agent.name
 
         if not comments:
@@ -201,7 +278,7 @@ class NotionBot(CommsBotBase):
             discussion_id = comment['discussion_id']
             comment_id = comment['id']
             created_by_user_id = comment['created_by']['id']
-            anchor_block_id = comment['parent']['block_id']
+            anchor_block_id = comment['parent'].get('block_id', page_id)
 
             has_mention = False
             content = ''
@@ -218,11 +295,16 @@ class NotionBot(CommsBotBase):
                     print(f"Received comment block type: {block['type']} which we do not yet support")
 
             if has_mention:
-                sender = self.client.users.retrieve(created_by_user_id)
-                sender_email = sender['person']['email']
+                sender_email = self.get_user_email(created_by_user_id)
+
+                # The anchor block is usually one of the page's blocks we already listed
+                blocks = {block["id"]: block for block in self.get_page_blocks(page_id, last_edited_time)}
+                if anchor_block_id in blocks:
+                    context_anchor, files_anchor = self.block_content(blocks[anchor_block_id])
+                else:
+                    context_anchor, files_anchor = self.get_block_content(anchor_block_id)
 
-                context_anchor, files_anchor = self.get_block_content(anchor_block_id)
-                context_page, files_page = self.get_page_content(page_id)
+                context_page, files_page = self.get_page_content(page_id, last_edited_time)
 
                 comments_to_address.append({
                     "page_url": page_url,
@@ -240,100 +322,311 @@ class NotionBot(CommsBotBase):
 
         return comments_to_address
 
-    def poll_for_comments(self, interval=300):
-        """Long poll for new pages updated since the last poll"""
-        agent_name = self.message_handler.agent.name
+    def poll_once(self, incremental=True):
+        """Scan pages for new comments mentioning the agent and return them.
 
-        while True:
-            print("Polling for new Notion comments...")
-            pages = self.get_all_pages()
-            for page in pages:
-                comments = self.get_page_comments_for_agent(page)
-                for comment in comments:
-                    comment_id = comment['id']
-                    if comment_id not in self.processed_comment_ids:
-                        print(f"Adding new comment from page {page['id']}")
-                        self.comment_queue.put(comment)
-                        self.processed_comment_ids.add(comment_id)
+        With `incremental`, only pages edited since the previous poll are scanned.
+        """
+        # Page snapshots are only valid for the duration of a cycle
+        self.page_snapshots.clear()
 
-            # Wait before polling again
-            time.sleep(interval)
+        watermark = self.get_watermark() if incremental else None
+        pages = self.get_pages_after(watermark) if watermark else self.get_all_pages()
+        print(f"Scanning {len(pages)} Notion pages edited since {watermark or 'the beginning'}")
 
-    def respond_to_comments(self, interval=300):
-        def download_files(files):
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
-            }
-            for file in files:
-                try:
-                    response = requests.get(file.url, headers=headers)
-                    response.raise_for_status()  # Raise an error for bad responses
-                    file.content = response.content
-                except requests.exceptions.RequestException as e:
-                    print(f"Error downloading file: {e}")
-            return files
-
-        def format_comment(comment):
-            text = (
-                f"Please address this comment on the Notion page with ID: {comment['page_id']} at URL {comment['page_url']}. "
-                "To address the comment, update the relevant blocks on the page and reply with a brief summary "
-                "(1-3 sentences) which will be used to reply to this comment. Context of the comment is provided below. We provide the full text of the page, the block which is the anchor of this comment, and the user info.\n\n"
-                "<START CONTEXT>\n\n"
-                f"<START PAGE CONTEXT>\n\n{comment['context_page']}\n\n<END PAGE CONTEXT>\n\n"
-                f"<START ANCHOR BLOCK CONTEXT>\n\nBLOCK ID: {comment['block_id']}\n{comment['context_block']}\n\n<END ANCHOR BLOCK CONTEXT>\n\n"
-                "<END CONTEXT>\n\n"
-                f"Comment from {comment['sender_email']}: {comment['content']}"
-            )
+        new_comments = []
+        failed = []
+        for page in pages:
+            try:
+                comments = self.get_page_comments_for_agent(page)
+            except Exception as e:
+                print(f"Error scanning page {page['id']} for comments: {e}")
+                failed.append(page)
+                continue
+            new_comments.extend(self.filter_new_comments(comments))
+
+        # Advance the watermark over the scanned pages, but never past a page that failed,
+        # so the next poll (which keeps pages at the watermark) scans it again
+        if pages:
+            newest = max(parse_time(page["last_edited_time"]) for page in pages)
+            if failed:
+                newest = min(newest, min(parse_time(page["last_edited_time"]) for page in failed))
+            if watermark is None or newest > watermark:
+                self.set_watermark(newest)
+
+        return new_comments
+
+    def filter_new_comments(self, comments):
+        """Keep the comments neither answered nor already queued, marking them as pending"""
+        new_comments = []
+        for comment in comments:
+            comment_id = comment['id']
+            if comment_id in self.processed_comment_ids:
+                continue
 
+            with self.pending_lock:
+                if comment_id in self.pending_comment_ids:
+                    continue
+                self.pending_comment_ids.add(comment_id)
 
-            files = comment['files_block'] if comment['files_block'] else comment['files_page']
-            files = download_files(files)
+            print(f"Adding new comment from page {comment['page_id']}")
+            new_comments.append(comment)
 
-            return ApplicationMessage(
-                user=comment['sender_email'],
-                text=text,
-                application="Notion",
-                files=files
-            )
+        return new_comments
+
+    def finish_comment(self, comment, answered):
+        """Stop tracking a queued comment, remembering it for good only if it was answered"""
+        if answered:
+            self.processed_comment_ids.add(comment['id'])
+        with self.pending_lock:
+            self.pending_comment_ids.discard(comment['id'])
 
+    def poll_for_comments(self, interval=300):
+        """Long poll for new pages updated since the last poll"""
         while True:
-            while not self.comment_queue.empty():
-                comment = self.comment_queue.get()
-                print(f"Received comment: {comment}")
+            print("Polling for new Notion comments...")
+            try:
+                for comment in self.poll_once():
+                    self.comment_queue.put(comment)
+            except Exception as e:
+                print(f"Error polling for comments: {e}")
 
-                try:
-                    print(f"Processing comment: {comment['id']} from {comment['sender_email']} on page {comment['page_id']}")
+            # Wait before polling again
+            time.sleep(interval)
 
-                    # Process the comment
-                    discussion_id = comment['discussion_id']
-                    message = format_comment(comment)
-                    text, attachments = self.message_handler.handle_message(message)
+    def download_files(self, files):
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'
+        }
+        for file in files:
+            try:
+                response = http_session().get(file.url, headers=headers)
+                response.raise_for_status()  # Raise an error for bad responses
+                file.content = response.content
+            except requests.exceptions.RequestException as e:
+                print(f"Error downloading file: {e}")
+        return files
+
+    def format_comment(self, comment) -> ApplicationMessage:
+        text = (
+            f"Please address this comment on the Notion page with ID: {comment['page_id']} at URL {comment['page_url']}. "
+            "To address the comment, update the relevant blocks on the page and reply with a brief summary "
+            "(1-3 sentences) which will be used to reply to this comment. Context of the comment is provided below. We provide the full text of the page, the block which is the anchor of this comment, and the user info.\n\n"
+            "<START CONTEXT>\n\n"
+            f"<START PAGE CONTEXT>\n\n{comment['context_page']}\n\n<END PAGE CONTEXT>\n\n"
+            f"<START ANCHOR BLOCK CONTEXT>\n\nBLOCK ID: {comment['block_id']}\n{comment['context_block']}\n\n<END ANCHOR BLOCK CONTEXT>\n\n"
+            "<END CONTEXT>\n\n"
+            f"Comment from {comment['sender_email']}: {comment['content']}"
+        )
+
+
+        files = comment['files_block'] if comment['files_block'] else comment['files_page']
+        files = self.download_files(files)
+
+        return ApplicationMessage(
+            user=comment['sender_email'],
+            text=text,
+            application="Notion",
+            files=files
+        )
+
+    def reply_to_comment(self, comment, text):
+        """Post a reply in the comment's discussion"""
+        response = self.client.comments.create(
+            discussion_id=comment['discussion_id'],
+            rich_text=[{"type": "text", "text": {"content": text}}]
+        )
+
+        print(f"Posted response: {response}")
+        return response
+
+    def respond_to_comment(self, comment):
+        print(f"Processing comment: {comment['id']} from {comment['sender_email']} on page {comment['page_id']}")
+
+        # Process the comment
+        message = self.format_comment(comment)
+        text, attachments = self.message_handler.handle_message(message)
+
+        # Post response to Notion
+        self.reply_to_comment(comment, text)
+
+    def respond_to_comments(self):
+        """Respond to comments as soon as they are queued"""
+        while True:
+            # Block until a comment arrives
+            comment = self.comment_queue.get()
+            print(f"Received comment: {comment}")
+
+            answered = False
+            try:
+                self.respond_to_comment(comment)
+                answered = True
+            except Exception as e:
+                print(f"Error processing comment: {e}")
+            finally:
+                self.finish_comment(comment, answered)
+                self.comment_queue.task_done()
+
+    def verify_webhook(self, body: bytes, signature: str) -> bool:
+        """Check the X-Notion-Signature header (HMAC-SHA256 of the body keyed by the verification token)"""
+        if not self.webhook_secret or not signature:
+            return False
+
+        expected = "sha256=" + hmac.new(self.webhook_secret.encode(), body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+    def get_comment(self, comment_id):
+        return self.client.request(path=f"comments/{comment_id}", method="GET")
+
+    def handle_webhook_event(self, event):
+        """Queue comments mentioning the agent from a Notion webhook event"""
+        event_type = event.get("type")
+        entity = event.get("entity", {})
+        data = event.get("data", {})
+
+        if event_type == "comment.created":
+            page_id = data["page_id"]
+            page = self.client.pages.retrieve(page_id)
+            comments = self.comments_for_agent(page, [self.get_comment(entity["id"])])
+        elif event_type == "page.content_updated":
+            page_id = entity["id"]
+            page = self.client.pages.retrieve(page_id)
+            comments = self.get_page_comments_for_agent(page)
+        else:
+            print(f"Ignoring Notion webhook event of type {event_type}")
+            return
 
-                    # Post response to Notion
-                    response = self.client.comments.create(
-                        discussion_id=discussion_id,
-                        rich_text=[{"type": "text", "text": {"content": text}}]
-                    )
+        # Snapshots are per poll cycle, don't let webhook fetches accumulate
+        for key in list(self.page_snapshots):
+            if key[0] == page_id:
+                self.page_snapshots.pop(key, None)
 
-                    print(f"Posted response: {response}")
-                except Exception as e:
-                    print(f"Error processing comment: {e}")
-                finally:
-                    self.comment_queue.task_done()
+        for comment in self.filter_new_comments(comments):
+            self.comment_queue.put(comment)
 
-            # Wait before polling again
-            time.sleep(interval)
+    def process_webhook_events(self):
+        """Handle queued webhook events one at a time, off the HTTP request threads"""
+        while True:
+            event = self.webhook_events.get()
+            try:
+                self.handle_webhook_event(event)
+            except Exception as e:
+                print(f"Error handling Notion webhook event: {e}")
+            finally:
+                self.webhook_events.task_done()
+
+    def serve_webhooks(self, port=8080):
+        """Receive Notion webhook events on a local HTTP endpoint"""
+        bot = self
+
+        worker = threading.Thread(target=self.process_webhook_events, name="notion-webhooks")
+        worker.daemon = True
+        worker.start()
+
+        class WebhookHandler(BaseHTTPRequestHandler):
+            def respond(self, status):
+                # An explicit empty body lets Notion's request complete as soon as it is sent
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                try:
+                    event = json.loads(body)
+                except json.JSONDecodeError:
+                    self.respond(400)
+                    return
+
+                # One-off handshake when the subscription is created
+                if "verification_token" in event:
+                    print(f"Notion webhook verification token: {event['verification_token']}. Set it as NOTION_WEBHOOK_SECRET.")
+                    self.respond(200)
+                    return
+
+                if not bot.verify_webhook(body, self.headers.get("X-Notion-Signature")):
+                    print("Rejected Notion webhook event with an invalid signature")
+                    self.respond(401)
+                    return
+
+                # Acknowledge right away and leave the (possibly slow) page scan to the worker,
+                # Notion retries deliveries that take too long
+                bot.webhook_events.put(event)
+                self.respond(200)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), WebhookHandler)
+        print(f"Listening for Notion webhooks on port {port}")
+        server.serve_forever()
+
+    def start(self, interval=300, mode="poll", port=8080, reconcile_interval=3600):
+        """Start ingesting and responding to comments.
+
+        mode="poll" scans for comments every `interval` seconds. mode="webhook" takes comments from
+        webhook events on `port` and only polls every `reconcile_interval` seconds to catch missed events.
+        """
+        if mode == "webhook":
+            webhook_thread = threading.Thread(target=self.serve_webhooks, args=(port,))
+            webhook_thread.daemon = True
+            webhook_thread.start()
+            interval = reconcile_interval
 
-    def start(self, interval=300):
         # Start the polling thread
         polling_thread = threading.Thread(target=self.poll_for_comments, args=(interval,))
         polling_thread.daemon = True
         polling_thread.start()
 
-        # Start the response thread
-        response_thread = threading.Thread(target=self.respond_to_comments, args=(interval,))
-        response_thread.daemon = True
-        response_thread.start()
+        # Start the response workers
+        for i in range(self.responders):
+            response_thread = threading.Thread(target=self.respond_to_comments, name=f"notion-responder-{i}")
+            response_thread.daemon = True
+            response_thread.start()
+
+
+class AsyncNotionBot(NotionBot, AsyncCommsBotBase):
+    """NotionBot that polls and responds as tasks on a shared event loop"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.async_comment_queue: asyncio.Queue = None
+
+    async def poll_for_comments(self, interval=300):
+        while True:
+            print("Polling for new Notion comments...")
+            try:
+                # The Notion client is synchronous, run the scan off the loop
+                for comment in await asyncio.to_thread(self.poll_once):
+                    await self.async_comment_queue.put(comment)
+            except Exception as e:
+                print(f"Error polling for comments: {e}")
+
+            await asyncio.sleep(interval)
+
+    async def respond_to_comment(self, comment):
+        print(f"Processing comment: {comment['id']} from {comment['sender_email']} on page {comment['page_id']}")
+        message = await asyncio.to_thread(self.format_comment, comment)
+        text, attachments = await self.respond(message)
+        await asyncio.to_thread(self.reply_to_comment, comment, text)
+
+    async def respond_to_comments(self):
+        while True:
+            comment = await self.async_comment_queue.get()
+            answered = False
+            try:
+                await self.respond_to_comment(comment)
+                answered = True
+            except Exception as e:
+                print(f"Error processing comment: {e}")
+            finally:
+                self.finish_comment(comment, answered)
+                self.async_comment_queue.task_done()
+
+    async def run(self, interval=300):
+        self.async_comment_queue = asyncio.Queue()
+        responders = [self.respond_to_comments() for _ in range(self.responders)]
+        await asyncio.gather(self.poll_for_comments(interval), *responders)
 
 
 if __name__ == "__main__":
@@ -1,44 +1,162 @@
+import asyncio
+import inspect
 import os
-import requests
 import time
+import random
 import threading
+import tempfile
+import mmap
 
+from concurrent.futures import ThreadPoolExecutor
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from dotenv import load_dotenv
-from agents.agent import MessageHandler
 from typing import List, Dict
 from utils.classes import File, ApplicationMessage
-from comms.base import CommsBotBase
+from utils.cache import TTLCache
+from utils.history import ConversationHistory
+from utils.clients import load_env, http_session
+from utils.ratelimit import rate_limited
+from comms.base import CommsBotBase, AsyncCommsBotBase
+
+
+# Attachments larger than this are streamed to disk instead of held in memory
+IN_MEMORY_MAX_SIZE = 8 * 1024 * 1024
+
+# Edits and deletions only update the history cache
+HISTORY_SUBTYPES = ("message_changed", "message_deleted")
+
+def supports_streaming(handler) -> bool:
+    """Whether a message handler accepts the streaming callbacks"""
+    try:
+        return "on_text_delta" in inspect.signature(handler.handle_message).parameters
+    except (TypeError, ValueError):
+        return False
+
+def message_text(event, files) -> str:
+    """A message's text, noting any attachments that could not be downloaded"""
+    missing = len(event.get("files") or []) - len(files)
+    if missing:
+        return event['text'] + f"\n\n({missing} attached file(s) could not be downloaded.)"
+    return event['text']
+
+def as_file(attachment) -> File:
+    """Attachments come back as Files, or as {"file_id", "content"} dicts from the OpenAI agents"""
+    if isinstance(attachment, dict):
+        return File(
+            id=attachment.get("file_id"),
+            name=f"{attachment.get('file_id')}.png",
+            filetype="image",
+            content=attachment.get("content")
+        )
+    return attachment
+
+def file_key(file: File):
+    return file.id or file.name
+
+class ReplyStreamer:
+    """Posts a placeholder message and updates it as the reply streams in.
+
+    Updates are throttled to one per `min_interval` seconds to stay within chat.update's rate limit.
+    """
+
+    def __init__(self, client, channel, format_msg, min_interval=1.0):
+        self.client = client
+        self.channel = channel
+        self.format_msg = format_msg
+        self.min_interval = min_interval
+
+        self.text = ""
+        self.images = []
+        self.uploaded = set()
+        self.last_update = 0
+        self.lock = threading.Lock()
+
+        response = client.chat_postMessage(channel=channel, text="_Thinking..._")
+        self.ts = response['ts']
+
+    def _update(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            if not force and now - self.last_update < self.min_interval:
+                return
+            self.last_update = now
+            msg = self.format_msg(self.text or "_Thinking..._", attachments=self.images or None)
+
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, **msg)
+        except Exception as e:
+            print(f"Failed to update streamed message: {str(e)}")
 
+    def add_text(self, delta):
+        with self.lock:
+            self.text += delta
+        self._update()
 
-load_dotenv('creds/.env')
+    def add_image(self, url):
+        with self.lock:
+            self.images.append(url)
+        self._update(force=True)
+
+    def finish(self, msg):
+        """Replace the streamed message with the final reply"""
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, **msg)
+        except Exception as e:
+            print(f"Failed to post final message: {str(e)}")
 
 class SlackBot(CommsBotBase):
-    def __init__(self):
+    def __init__(self, max_downloads=8, max_workers=16, stream_replies=True, history_size=50):
         super().__init__()
+        load_env()
         self.app = App(
             token=os.getenv("SLACK_BOT_TOKEN"),
             signing_secret=os.getenv("SLACK_SIGNING_SECRET")
         )
 
         self.workspace_info = {}
+        self.stream_replies = stream_replies
+
+        # Downloads share the process-wide connection pool, uploads and downloads run on these workers
+        self.session = http_session()
+        self.auth_headers = {"Authorization": f"Bearer {os.getenv('SLACK_BOT_TOKEN')}"}
+        self.file_pool = ThreadPoolExecutor(max_workers=max_downloads, thread_name_prefix="slack-files")
+
+        # Acks and full LLM turns run off Bolt's handler threads
+        self.ack_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="slack-ack")
+        self.worker_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="slack-worker")
+
+        # Repeat senders and workspace lookups cost no extra API calls
+        self.user_emails = TTLCache(maxsize=4096, ttl=60 * 60)
+        self.workspace_cache = TTLCache(maxsize=16, ttl=60 * 60)
+
+        # Recent channel and thread messages, kept current from message events
+        self.history = ConversationHistory(channel_size=history_size)
 
         # Register event handlers
         self._register_handlers()
 
     def _register_handlers(self):
         """Register all event handlers with Slack Bolt"""
+        self.app.use(self._rate_limit_client)
         self.app.event("message")(self.handle_message)
         self.app.event("app_mention")(self.handle_mention)
         self.app.event("app_home_opened")(self.handle_app_home_opened)
         self.app.event("member_joined_channel")(self.handle_channel_join)
         self.app.command("/bothelp")(self.handle_help_command)
 
+    def _rate_limit_client(self, context, next):
+        """Hand listeners a Web API client that shares the Slack rate limit and retries 429s"""
+        context["client"] = rate_limited(context.client, "slack")
+        # `say` is built lazily from the client, drop any built before the swap
+        context.pop("say", None)
+        next()
+
     def handle_message(self, event, say, client):
         """Route messages to appropriate handlers"""
+        self.history.add_event(event)
+
         # Skip bot messages
-        if event.get("bot_id"):
+        if event.get("bot_id") or event.get("subtype") in HISTORY_SUBTYPES:
             return
 
         channel_type = event.get("channel_type")
@@ -48,70 +166,109 @@ class SlackBot(CommsBotBase):
         elif channel_type in ["channel", "group", "mpim"]:
             self._handle_channel_message(event, say, client)
 
+    def _download_file(self, file) -> File:
+        """Stream a Slack file, spilling large ones to a memory-mapped temp file"""
+        with self.session.get(file["url_private"], headers=self.auth_headers, stream=True) as response:
+            response.raise_for_status()
+
+            if file.get("size", 0) <= IN_MEMORY_MAX_SIZE:
+                file_content = response.content
+            else:
+                # The mapping outlives the (anonymous) temp file, and is read in place on upload
+                with tempfile.TemporaryFile(prefix="slack-") as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                    f.flush()
+                    file_content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return File(
+            url=file.get("url_private", ""),
+            name=file.get("name", ""),
+            filetype=file.get("filetype", ""),
+            content=file_content
+        )
+
     def _process_files(self, event, client) -> List[File]:
-        """Process files attached to a message"""
-        files = []
+        """Download the files attached to a message concurrently"""
         if not event.get("files"):
-            return files
+            return []
+
+        def download(file):
+            try:
+                return self._download_file(file)
+            except Exception as e:
+                print(f"Error downloading Slack file {file.get('name')}: {e}")
+                return None
 
-        file_data = event["files"]
-        for file in file_data:
-            # Get file info
-            file_info = client.files_info(file=file["id"])
+        # A failed download only loses that file, not the whole message
+        return [file for file in self.file_pool.map(download, event["files"]) if file]
 
-            # Download the file content using the private URL
-            response = requests.get(
-                file["url_private"],
-                headers={"Authorization": f"Bearer {os.getenv('SLACK_BOT_TOKEN')}"}
+    def _upload_content(self, file: File):
+        # slack_sdk takes str or bytes, memory-mapped attachments need converting
+        return file.content if isinstance(file.content, (str, bytes)) else bytes(file.content)
+
+    def _upload_file(self, file: File, client):
+        """Upload a single file and return its initial file data"""
+        try:
+            upload_response = client.files_upload_v2(
+                file=self._upload_content(file),
+                filename=file.name
             )
-            file_content = response.content
 
-            files.append(File(
-                url=file.get("url_private", ""),
-                name=file.get("name", ""),
-                filetype=file.get("filetype", ""),
-                content=file_content
-            ))
+            file_data = upload_response.get('file')
+            if not file_data:
+                print(f"No file data received for {file.name}")
+            return file_data
+        except Exception as e:
+            print(f"Failed to upload file: {str(e)}")
+            return None
 
-        return files
+    def _file_info(self, file_data, client):
+        """Refresh file data, keeping the old data if the lookup fails"""
+        try:
+            return client.files_info(file=file_data['id']).get('file') or file_data
+        except Exception as e:
+            print(f"Failed to get file info: {str(e)}")
+            return file_data
+
+    def upload_files(self, files: List[File], client, max_retries=5, channel=None, thread_ts=None, initial_comment=None) -> List[str]:
+        """Upload files to Slack and return URLs.
+
+        With `channel`, the files are instead shared straight into the channel in one call, with
+        `initial_comment` as the message text, and nothing waits for them to be processed.
+        """
+        if channel:
+            client.files_upload_v2(
+                channel=channel,
+                thread_ts=thread_ts,
+                initial_comment=initial_comment,
+                file_uploads=[{"content": self._upload_content(file), "filename": file.name} for file in files]
+            )
+            return []
 
-    def upload_files(self, files: List[File], client, max_retries=5) -> List[str]:
-        """Upload files to Slack and return URLs"""
-        urls = []
-        for file in files:
-            try:
-                # Upload file to slack
-                upload_response = client.files_upload_v2(
-                    file=file.content,
-                    filename=file.name
-                )
+        # Upload concurrently, keeping the original order
+        uploaded = list(self.file_pool.map(lambda file: self._upload_file(file, client), files))
+        pending = {i: file_data for i, file_data in enumerate(uploaded) if file_data and not file_data.get('mimetype')}
 
-                # Get initial file data
-                file_data = upload_response.get('file')
-                if not file_data:
-                    print(f"No file data received for {file.name}")
-                    continue
-
-                # Wait for file to be fully processed
-                attempts = 0
-                while not file_data.get('mimetype'):
-                    attempts += 1
-                    if attempts >= max_retries:
-                        print(f"Gave up waiting for file {file.name} after {attempts} seconds")
-                        break
-
-                    time.sleep(1)
-                    file_info = client.files_info(file=file_data['id'])
-                    file_data = file_info.get('file')
-                    print(f"Waiting for file {file.name}, attempt {attempts}")
+        # Wait for the files to be processed, checking all pending files together with jittered backoff
+        attempts = 0
+        while pending and attempts < max_retries:
+            time.sleep(0.25 * 2 ** attempts * (0.5 + random.random()))
+            attempts += 1
 
+            file_infos = self.file_pool.map(lambda file_data: self._file_info(file_data, client), pending.values())
+            for i, file_data in zip(list(pending), file_infos):
+                uploaded[i] = file_data
                 if file_data.get('mimetype'):
-                    print(f"File ready after {attempts}s: {file.name}")
-                    urls.append(file_data['url_private'])
+                    del pending[i]
+            print(f"Waiting for {len(pending)} files, attempt {attempts}")
 
-            except Exception as e:
-                print(f"Failed to upload file: {str(e)}")
-                continue
+        urls = []
+        for file, file_data in zip(files, uploaded):
+            if file_data and file_data.get('mimetype'):
+                urls.append(file_data['url_private'])
+            elif file_data:
+                print(f"Gave up waiting for file {file.name} after {attempts} attempts")
 
         return urls
 
@@ -119,44 +276,24 @@ class SlackBot(CommsBotBase):
         """Handle @mentions of the bot"""
         self._send_ack(event, client)
 
-        channel_info = client.conversations_info(channel=event['channel'])
-
-        user_info = client.users_info(user=event['user'])
-        email = user_info['user']['profile']['email']
-
-        # Handle any files attached to the message
-        files = self._process_files(event, client)
-
-        message = ApplicationMessage(
-            user=email,
-            text=event['text'],
-            application="Slack",
-            files=files
-        )
-
-        attachments = None
-        try:
-            text, images = self.message_handler.handle_message(message)
-            if images:
-                attachments = [file.url for file in images]
-        except Exception as e:
-            print(f"Error in message handler: {str(e)}")
-
-        formatted_msg = self._format_msg(text, attachments=attachments)
-
-        say(formatted_msg)
+        # Return to Bolt right away, the LLM turn runs on a worker
+        self.worker_pool.submit(self._reply, event, say, client)
 
     def handle_app_home_opened(self, client, event):
         """Handle app home opened events"""
-        team_info = client.team_info()
-        self.workspace_info = {
-            'name': team_info['team']['name'],
-            'email': team_info['team']['email_domain']
-        }
+        def load_workspace_info():
+            team_info = client.team_info()
+            return {
+                'name': team_info['team']['name'],
+                'email': team_info['team']['email_domain']
+            }
+
+        self.workspace_info = self.workspace_cache.get_or_load('workspace_info', load_workspace_info)
 
     def handle_channel_join(self, event, say, client):
         """Handle bot being added to channels"""
-        if event.get("user") == client.auth_test()["user_id"]:
+        bot_user_id = self.workspace_cache.get_or_load('bot_user_id', lambda: client.auth_test()["user_id"])
+        if event.get("user") == bot_user_id:
             say("Thanks for adding me! Happy to be of service.")
 
     def handle_help_command(self, ack, respond, command):
@@ -170,12 +307,18 @@ class SlackBot(CommsBotBase):
         """)
 
     def _send_ack(self, event, client):
-        # Respond with "watching" emoji
-        client.reactions_add(
-            channel=event['channel'],
-            name="eyes",
-            timestamp=event['ts']
-        )
+        # Respond with "watching" emoji, without waiting on the API call
+        def add_reaction():
+            try:
+                client.reactions_add(
+                    channel=event['channel'],
+                    name="eyes",
+                    timestamp=event['ts']
+                )
+            except Exception as e:
+                print(f"Failed to add reaction: {str(e)}")
+
+        self.ack_pool.submit(add_reaction)
 
     def _format_msg(self, text, attachments=None):
         # remove lines with URLs that are in the attachments from the text
@@ -211,60 +354,340 @@ class SlackBot(CommsBotBase):
         """Handle direct messages"""
         self._send_ack(event, client)
 
-        user_info = client.users_info(user=event['user'])
-        email = user_info['user']['profile']['email']
+        # Return to Bolt right away, the LLM turn runs on a worker
+        self.worker_pool.submit(self._reply, event, say, client)
+
+    def _stream_attachment(self, streamer, attachment, client, event):
+        """Show an attachment produced mid-run: inline if it has a URL, else as an upload"""
+        file = as_file(attachment)
+        if file.url:
+            streamer.add_image(file.url)
+        elif file.content:
+            self.upload_files([file], client, channel=event['channel'], thread_ts=event.get('thread_ts'))
+            streamer.uploaded.add(file_key(file))
+
+    def _load_history(self, channel, thread_ts, client) -> List[Dict]:
+        """Recent messages of a channel or thread, fetched from Slack only the first time"""
+        if self.history.needs_backfill(channel, thread_ts):
+            if thread_ts:
+                response = client.conversations_replies(channel=channel, ts=thread_ts, limit=self.history.thread_size)
+            else:
+                response = client.conversations_history(channel=channel, limit=self.history.channel_size)
+            self.history.backfill(channel, response['messages'], thread_ts)
+
+        if thread_ts:
+            return self.history.thread_messages(channel, thread_ts)
+        return self.history.channel_messages(channel)
+
+    def _format_context(self, event, messages) -> str:
+        """Earlier messages of the conversation a channel message was posted in, for the agent"""
+        lines = [
+            f"<@{message.get('user') or message.get('bot_id')}>: {message.get('text', '')}"
+            for message in messages if message.get("ts") != event.get("ts")
+        ]
+        if not lines:
+            return None
+        return "Recent messages in this Slack conversation:\n" + "\n".join(lines)
+
+    def _get_user_email(self, user_id, client):
+        return self.user_emails.get_or_load(
+            user_id,
+            lambda: client.users_info(user=user_id)['user']['profile']['email']
+        )
+
+    def _reply(self, event, say, client):
+        """Pass a DM or mention to the message handler and post its reply"""
+        try:
+            email = self._get_user_email(event['user'], client)
+
+            # Handle any files attached to the message
+            files = self._process_files(event, client)
+
+            # Mentions in channels come with the surrounding conversation
+            context = None
+            if event.get("channel_type") != "im":
+                messages = self._load_history(event['channel'], event.get('thread_ts'), client)
+                context = self._format_context(event, messages)
+
+            message = ApplicationMessage(
+                user=email,
+                text=message_text(event, files),
+                application="Slack",
+                files=files,
+                context=context
+            )
+
+            # Stream the reply into a placeholder message if the handler supports it
+            streamer = None
+            kwargs = {}
+            if self.stream_replies and supports_streaming(self.message_handler):
+                streamer = ReplyStreamer(client, event['channel'], self._format_msg)
+                kwargs = {
+                    "on_text_delta": streamer.add_text,
+                    "on_attachment": lambda attachment: self._stream_attachment(streamer, attachment, client, event)
+                }
+
+            attachments = None
+            local_files = []
+            try:
+                text, images = self.message_handler.handle_message(message, **kwargs)
+                if images:
+                    images = [as_file(image) for image in images]
+                    attachments = [file.url for file in images if file.url] or None
+
+                    # Files with no public URL are attached directly instead
+                    local_files = [file for file in images if not file.url and file.content]
+                    if streamer:
+                        local_files = [file for file in local_files if file_key(file) not in streamer.uploaded]
+            except Exception as e:
+                print(f"Error in message handler: {str(e)}")
+                text = f"Sorry, I encountered an error: {str(e)}"
+
+            formatted_msg = self._format_msg(text, attachments=attachments)
+
+            if streamer:
+                streamer.finish(formatted_msg)
+            else:
+                say(formatted_msg)
+
+            if local_files:
+                self.upload_files(local_files, client, channel=event['channel'], thread_ts=event.get('thread_ts'))
+        except Exception as e:
+            print(f"Error replying to Slack message: {str(e)}")
+
+    def _handle_channel_message(self, event, say, client):
+        """Handle messages in channels"""
+        # The message is already in the history cache; the conversation is backfilled
+        # from the API only when a mention needs it as context
+        print(f"Saw message in channel: {event['text']}")
+
+    def start(self):
+        """Start the bot"""
+        handler = SocketModeHandler(self.app, os.environ["SLACK_APP_TOKEN"])
+
+        # Run the handler in a separate thread
+        handler_thread = threading.Thread(target=handler.start)
+        handler_thread.daemon = True
+        handler_thread.start()
+
+class AsyncSlackBot(SlackBot, AsyncCommsBotBase):
+    """SlackBot on the Bolt async app, hosted on a shared event loop"""
+
+    def __init__(self):
+        AsyncCommsBotBase.__init__(self)
+        load_env()
+
+        # The async stack (aiohttp) is only imported when it is used
+        from slack_bolt.async_app import AsyncApp
+        self.app = AsyncApp(
+            token=os.getenv("SLACK_BOT_TOKEN"),
+            signing_secret=os.getenv("SLACK_SIGNING_SECRET")
+        )
+
+        self.workspace_info = {}
+        self.user_emails = TTLCache(maxsize=4096, ttl=60 * 60)
+        self.workspace_cache = TTLCache(maxsize=16, ttl=60 * 60)
+        self.history = ConversationHistory()
+
+        # Acks run as tasks on the loop, referenced here until they finish
+        self.background_tasks = set()
+
+        # Register event handlers
+        self._register_handlers()
+
+    async def _rate_limit_client(self, context, next):
+        """Hand listeners a Web API client that shares the Slack rate limit and retries 429s"""
+        context["client"] = rate_limited(context.client, "slack")
+        context.pop("say", None)
+        await next()
+
+    async def handle_message(self, event, say, client):
+        """Route messages to appropriate handlers"""
+        self.history.add_event(event)
+
+        # Skip bot messages
+        if event.get("bot_id") or event.get("subtype") in HISTORY_SUBTYPES:
+            return
+
+        channel_type = event.get("channel_type")
+
+        if channel_type == "im":
+            await self._handle_dm(event, say, client)
+        elif channel_type in ["channel", "group", "mpim"]:
+            await self._handle_channel_message(event, say, client)
+
+    async def _process_files(self, event, client) -> List[File]:
+        """Download files attached to a message concurrently"""
+        if not event.get("files"):
+            return []
+
+        headers = {"Authorization": f"Bearer {os.getenv('SLACK_BOT_TOKEN')}"}
+        import aiohttp
+        async with aiohttp.ClientSession(headers=headers) as session:
+            async def download(file):
+                async with session.get(file["url_private"]) as response:
+                    response.raise_for_status()
+                    return File(
+                        url=file.get("url_private", ""),
+                        name=file.get("name", ""),
+                        filetype=file.get("filetype", ""),
+                        content=await response.read()
+                    )
+
+            results = await asyncio.gather(*(download(file) for file in event["files"]), return_exceptions=True)
+
+        files = []
+        for file, result in zip(event["files"], results):
+            if isinstance(result, Exception):
+                print(f"Error downloading Slack file {file.get('name')}: {result}")
+            else:
+                files.append(result)
+        return files
+
+    async def _send_ack(self, event, client):
+        # Respond with "watching" emoji, without waiting on the API call
+        async def add_reaction():
+            try:
+                await client.reactions_add(
+                    channel=event['channel'],
+                    name="eyes",
+                    timestamp=event['ts']
+                )
+            except Exception as e:
+                print(f"Failed to add reaction: {str(e)}")
+
+        task = asyncio.create_task(add_reaction())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def _get_user_email(self, user_id, client):
+        email = self.user_emails.get(user_id)
+        if email is None:
+            user_info = await client.users_info(user=user_id)
+            email = user_info['user']['profile']['email']
+            self.user_emails.set(user_id, email)
+        return email
+
+    async def _reply(self, event, say, client):
+        """Pass a DM or mention to the message handler and post its reply"""
+        await self._send_ack(event, client)
+
+        try:
+            await self._respond_to_event(event, say, client)
+        except Exception as e:
+            print(f"Error replying to Slack message: {str(e)}")
+            try:
+                await say(f"Sorry, I encountered an error: {str(e)}")
+            except Exception as e:
+                print(f"Failed to post error reply: {str(e)}")
+
+    async def _respond_to_event(self, event, say, client):
+        """One turn of `_reply`: build the message, ask the handler and post its answer"""
+        email = await self._get_user_email(event['user'], client)
 
         # Handle any files attached to the message
-        files = self._process_files(event, client)
+        files = await self._process_files(event, client)
+
+        context = None
+        if event.get("channel_type") != "im":
+            messages = await self._load_history(event['channel'], event.get('thread_ts'), client)
+            context = self._format_context(event, messages)
 
         message = ApplicationMessage(
             user=email,
-            text=event['text'],
+            text=message_text(event, files),
             application="Slack",
-            files=files
+            files=files,
+            context=context
         )
 
         attachments = None
+        local_files = []
         try:
-            text, images = self.message_handler.handle_message(message)
+            text, images = await self.respond(message)
             if images:
-                attachments = [file.url for file in images]
+                images = [as_file(image) for image in images]
+                attachments = [file.url for file in images if file.url] or None
+
+                # Files with no public URL are attached directly instead
+                local_files = [file for file in images if not file.url and file.content]
         except Exception as e:
             print(f"Error in message handler: {str(e)}")
+            text = f"Sorry, I encountered an error: {str(e)}"
 
-        formatted_msg = self._format_msg(text, attachments=attachments)
+        await say(self._format_msg(text, attachments=attachments))
 
-        say(formatted_msg)
+        if local_files:
+            try:
+                await client.files_upload_v2(
+                    channel=event['channel'],
+                    thread_ts=event.get('thread_ts'),
+                    file_uploads=[{"content": self._upload_content(file), "filename": file.name} for file in local_files]
+                )
+            except Exception as e:
+                print(f"Failed to upload attachments: {str(e)}")
 
-    def _handle_channel_message(self, event, say, client):
-        """Handle messages in channels"""
-        print(f"Saw message in channel: {event['text']}")
+    async def handle_mention(self, event, say, client):
+        """Handle @mentions of the bot"""
+        await self._reply(event, say, client)
 
-        # Get thread context
-        thread_ts = event.get("thread_ts")
-        if thread_ts:
-            thread_messages = client.conversations_replies(
-                channel=event['channel'],
-                ts=thread_ts
-            )
-            print(f"Thread has {len(thread_messages['messages'])} messages")
+    async def _handle_dm(self, event, say, client):
+        """Handle direct messages"""
+        await self._reply(event, say, client)
 
-        # Get channel history
-        history = client.conversations_history(
-            channel=event['channel'],
-            limit=10
-        )
+    async def handle_app_home_opened(self, client, event):
+        """Handle app home opened events"""
+        workspace_info = self.workspace_cache.get('workspace_info')
+        if workspace_info is None:
+            team_info = await client.team_info()
+            workspace_info = {
+                'name': team_info['team']['name'],
+                'email': team_info['team']['email_domain']
+            }
+            self.workspace_cache.set('workspace_info', workspace_info)
+        self.workspace_info = workspace_info
 
-        print(f"Channel history has {len(history['messages'])} messages")
+    async def handle_channel_join(self, event, say, client):
+        """Handle bot being added to channels"""
+        bot_user_id = self.workspace_cache.get('bot_user_id')
+        if bot_user_id is None:
+            bot_user_id = (await client.auth_test())["user_id"]
+            self.workspace_cache.set('bot_user_id', bot_user_id)
+        if event.get("user") == bot_user_id:
+            await say("Thanks for adding me! Happy to be of service.")
+
+    async def handle_help_command(self, ack, respond, command):
+        """Handle /bothelp command"""
+        await ack()
+        await respond("""Here's what I can do:
+        - Respond to DMs
+        - Reply when @mentioned
+        - See all messages in channels I'm in
+        - Use /bothelp for this help message
+        """)
 
-    def start(self):
-        """Start the bot"""
-        handler = SocketModeHandler(self.app, os.environ["SLACK_APP_TOKEN"])
+    async def _handle_channel_message(self, event, say, client):
+        """Handle messages in channels"""
+        print(f"Saw message in channel: {event['text']}")
 
-        # Run the handler in a separate thread
-        handler_thread = threading.Thread(target=handler.start)
-        handler_thread.daemon = True
-        handler_thread.start()
+    async def _load_history(self, channel, thread_ts, client) -> List[Dict]:
+        """Recent messages of a channel or thread, fetched from Slack only the first time"""
+        if self.history.needs_backfill(channel, thread_ts):
+            if thread_ts:
+                response = await client.conversations_replies(channel=channel, ts=thread_ts, limit=self.history.thread_size)
+            else:
+                response = await client.conversations_history(channel=channel, limit=self.history.channel_size)
+            self.history.backfill(channel, response['messages'], thread_ts)
+
+        if thread_ts:
+            return self.history.thread_messages(channel, thread_ts)
+        return self.history.channel_messages(channel)
+
+    async def run(self):
+        """Run the Socket Mode connection on the current event loop"""
+        from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+        handler = AsyncSocketModeHandler(self.app, os.environ["SLACK_APP_TOKEN"])
+        await handler.start_async()
 
 # Usage
 if __name__ == "__main__":
@@ -1,7 +1,13 @@
+import os
 import time
+import asyncio
 
-from comms.slack import SlackBot
-from comms.notion import NotionBot
+from utils.clients import load_env
+load_env()
+
+from comms.base import run_bots
+from comms.slack import SlackBot, AsyncSlackBot
+from comms.notion import NotionBot, AsyncNotionBot
 
 # from agents.agent import Agent
 # from tools.employeeOS import EmployeeOS
@@ -9,8 +15,8 @@ from comms.notion import NotionBot
 from agents.agent_autogen import Agent
 from tools.employeeOS_autogen import EmployeeOS
 
-from utils.delete import delete_assistants_and_files
-delete_assistants_and_files()
+from utils.delete import start_reaper
+from utils.artifacts import artifacts_enabled, start_artifact_server
 
 # Agent
 agent = Agent(
@@ -20,15 +26,32 @@ agent = Agent(
 )
 employee = EmployeeOS(agent)
 
+# Charts and images are served locally when the artifact server has a public URL (ARTIFACT_BASE_URL)
+if artifacts_enabled():
+    start_artifact_server()
+
+# Cleaning up old assistants and files is opt-in, runs daily in the background,
+# and starts after the assistants above are registered so they are kept
+if os.getenv("CLEANUP_ON_START", "false").lower() == "true":
+    start_reaper(older_than=float(os.getenv("CLEANUP_OLDER_THAN_HOURS", 24)) * 60 * 60)
+
 # Comms
-slackbot = SlackBot()
-notionbot = NotionBot()
+if os.getenv("COMMS_MODE") == "async":
+    # All bots share a single event loop
+    bots = [AsyncSlackBot(), AsyncNotionBot()]
+    for bot in bots:
+        bot.message_handler = employee
+
+    asyncio.run(run_bots(*bots))
+else:
+    slackbot = SlackBot()
+    notionbot = NotionBot()
 
-slackbot.message_handler = employee
-notionbot.message_handler = employee
+    slackbot.message_handler = employee
+    notionbot.message_handler = employee
 
-slackbot.start()
-notionbot.start()
+    slackbot.start()
+    notionbot.start(mode=os.getenv("NOTION_MODE", "poll"))
 
-while True:
-    time.sleep(1)
\ No newline at end of file
+    while True:
+        time.sleep(1)
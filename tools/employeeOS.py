@@ -1,18 +1,20 @@
 import os
-import time
 import json
 import sys
+import threading
 
-from openai import OpenAI
-from dotenv import load_dotenv
 from typing import List, Dict
 from utils.classes import File, Message, ApplicationMessage
+from utils.runs import stream_run
+from utils.uploads import upload_files
+from utils.assistants import assistant_registry
+from utils.clients import openai_client
+from utils.budget import HistoryBudget
+from utils.sessions import SessionStore, SQLiteSessionStore, PrefixedSessionStore
 
 from agents.agent import Agent, File, MessageHandler
 from tools.notion import tool_specs as tool_specs_notion, tool_maps as tool_maps_notion
 
-load_dotenv('creds/.env', override=True)
-
 
 tool_spec_agent = [{
     "type": "function",
@@ -42,8 +44,9 @@ tool_spec_agent = [{
 }]
 
 class EmployeeOS(MessageHandler):
-    def __init__(self, agent, model="gpt-4o-mini", force=False):
-        self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    def __init__(self, agent, model="gpt-4o-mini", force=False, max_runs=8,
+                 session_store: SessionStore = None, user_lock_stripes=64):
+        self.client = openai_client()
 
         instructions = f"""You are a generalist employee.
         You have access to various communication tools like Notion and Slack.
@@ -54,13 +57,6 @@ class EmployeeOS(MessageHandler):
         self.agent = agent
         self.name = "Employee"
         self.instructions = instructions
-        self.agent_attachments = []
-
-        # Create or load assistant
-        self.assistant = self.create_assistant(self.name, instructions, model=model, force=force)
-
-        # Track threads per user
-        self.threads: Dict[str, str] = {}
 
         tool_maps_agent = {"chat_with_agent": self.chat_with_agent}
 
@@ -68,22 +64,48 @@ class EmployeeOS(MessageHandler):
         tools = tool_spec_agent + tool_specs_notion
 
         self.tool_maps = tool_maps
-        self.add_tools(tools)
-
-    def create_assistant(self, name, instructions, model="gpt-4o-mini", force=False):
-        # Create or load assistant if name already exists
-        # if not force:
-        #     assistants = self.client.beta.assistants.list(limit=100).data
-        #     for assistant in assistants:
-        #         if assistant.name == name:
-        #             return assistant
-
-        return self.client.beta.assistants.create(
-            name="Employee",
-            instructions=instructions,
-            tools=[{"type": "code_interpreter"}, {"type": "file_search"}],
-            model=model
-        )
+
+        # Create or load assistant
+        self.assistant = self.create_assistant(self.name, instructions, tools=tools, model=model, force=force)
+
+        # Track threads per user, persisted across restarts with recently active users kept in memory.
+        # Threads roll over to a summary once they outgrow the token budget, counted in the same store
+        self.threads = session_store or SQLiteSessionStore("employee_threads")
+        token_store = PrefixedSessionStore(session_store, "tokens:") if session_store else SQLiteSessionStore("employee_thread_tokens")
+        self.history = HistoryBudget(self.client, model=model, store=token_store)
+
+        # Conversations for the same user are serialized, different users mostly run concurrently.
+        # A fixed set of locks keeps memory flat however many users there are
+        self.user_locks = [threading.Lock() for _ in range(user_lock_stripes)]
+        self.run_slots = threading.BoundedSemaphore(max_runs)
+
+        # Per-request state (e.g. attachments produced by the agent during tool calls)
+        self._request = threading.local()
+
+    @property
+    def agent_attachments(self) -> List[Dict]:
+        """Attachments produced by the AI Analyst during the current request"""
+        if not hasattr(self._request, "attachments"):
+            self._request.attachments = []
+        return self._request.attachments
+
+    def user_lock(self, user_id: str) -> threading.Lock:
+        return self.user_locks[hash(user_id) % len(self.user_locks)]
+
+    def create_assistant(self, name, instructions, tools=None, model="gpt-4o-mini", force=False):
+        """Reuse the assistant registered under this name, or create it. `force` always creates a new one"""
+        config = {
+            "instructions": instructions,
+            "tools": [{"type": "code_interpreter"}, {"type": "file_search"}] + (tools or []),
+            "model": model
+        }
+
+        if force:
+            assistant = self.client.beta.assistants.create(name=name, **config)
+            assistant_registry.register(name, assistant.id, config)
+            return assistant
+
+        return assistant_registry.get_or_create(self.client, name, **config)
 
     def add_tools(self, tool_specs: List[Dict]):
         """Add a tool to the assistant"""
@@ -94,13 +116,8 @@ class EmployeeOS(MessageHandler):
 
     def add_files(self, files: List[File], thread_id):
         """Upload files to the assistant"""
-        file_ids = []
-        for file in files:
-            uploaded_file = self.client.files.create(
-                file=file.content,
-                purpose='assistants'
-            )
-            file_ids.append({"id": uploaded_file.id, "name": file.name})
+        uploaded_ids = upload_files(self.client, files)
+        file_ids = [{"id": file_id, "name": file.name} for file, file_id in zip(files, uploaded_ids)]
 
         # try:
         #     file_ids = self.agent.add_files(files)
@@ -123,9 +140,16 @@ class EmployeeOS(MessageHandler):
         if message.files:
             self.agent.add_files(message.files)
 
-        response_text, attachments = self.agent.handle_message(message)
+        # The analyst keeps a thread per user, so different users' analyses run concurrently
+        response_text, attachments = self.agent.handle_message(message, session=getattr(self._request, "user_id", None))
         self.agent_attachments.extend(attachments)
 
+        # Let a streaming caller show the agent's files right away
+        on_attachment = getattr(self._request, "on_attachment", None)
+        if on_attachment:
+            for attachment in attachments:
+                on_attachment(attachment)
+
         if attachments:
             response_text += "Attachments (These will be automatically sent to the user in your followup reply. Do not reference these.):"
             for attachment in attachments:
@@ -133,7 +157,8 @@ class EmployeeOS(MessageHandler):
 
         return response_text
 
-    def run_tool(self, run, thread_id):
+    def run_tool(self, run) -> List[Dict]:
+        """Execute the tool calls a run is waiting on and return their outputs"""
         tool_outputs = []
         for tool in run.required_action.submit_tool_outputs.tool_calls:
             if tool.function.name in self.tool_maps:
@@ -151,18 +176,12 @@ class EmployeeOS(MessageHandler):
             else:
                 print(f"Tool {tool.function.name} not found in tool maps.")
 
-        if tool_outputs:
-            try:
-                self.client.beta.threads.runs.submit_tool_outputs_and_poll(
-                    thread_id=thread_id,
-                    run_id=run.id,
-                    tool_outputs=tool_outputs
-                )
-                print("Tool outputs submitted successfully.")
-            except Exception as e:
-                print("Failed to submit tool outputs:", e)
-        else:
-            print("No tool outputs to submit.")
+        # Tool outputs (e.g. the AI Analyst's replies) stay in the thread, so they count towards its budget
+        user_id = getattr(self._request, "user_id", None)
+        if user_id is not None:
+            self.history.add(user_id, *(tool_output["output"] for tool_output in tool_outputs))
+
+        return tool_outputs
 
     def process_attachment(self, file_id) -> Dict:
         try:
@@ -224,65 +243,82 @@ class EmployeeOS(MessageHandler):
                 elif content.type == 'image_file':
                     print(f"{color}{role}: Attachment: {content.image_file.file_id}{RESET}")
 
-    def handle_message(self, appMessage: ApplicationMessage) -> str:
+    def handle_message(self, appMessage: ApplicationMessage, on_text_delta=None, on_attachment=None) -> str:
+        """Respond to a message, returning (text, attachments).
+
+        Optionally, `on_text_delta(text)` is called with reply text as it streams in,
+        and `on_attachment(attachment)` with each attachment as soon as it is available.
+        """
+        # One conversation per user at a time, and a cap on runs in flight overall
+        with self.user_lock(appMessage.user), self.run_slots:
+            self._request.attachments = []
+            self._request.on_attachment = on_attachment
+            self._request.user_id = appMessage.user
+            try:
+                return self._handle_message(appMessage, on_text_delta=on_text_delta)
+            finally:
+                self._request.attachments = []
+                self._request.on_attachment = None
+                self._request.user_id = None
+
+    def _handle_message(self, appMessage: ApplicationMessage, on_text_delta=None) -> str:
         user_id = appMessage.user
         content = appMessage.text
 
         print(f'{self.name} received message from {user_id}: "{content}"')
 
+        if appMessage.context:
+            content = f"{appMessage.context}\n\n{content}"
+
         message = {"role": "user", "content": content}
 
         try:
             # Create thread with just the text message
-            if user_id not in self.threads:
+            thread_id = self.threads.get(user_id)
+
+            if thread_id is not None and self.history.over_budget(user_id):
+                thread_id = self.history.roll_over_thread(user_id, thread_id)
+                self.threads.set(user_id, thread_id)
+
+            if thread_id is None:
                 thread = self.client.beta.threads.create(messages=[message])
-                self.threads[user_id] = thread.id
+                thread_id = thread.id
+                self.threads.set(user_id, thread_id)
             else:
                 self.client.beta.threads.messages.create(
-                    thread_id=self.threads[user_id],
+                    thread_id=thread_id,
                     **message)
 
-            thread_id = self.threads[user_id]
-
             # Upload any files
             if appMessage.files:
                 self.add_files(appMessage.files, thread_id)
 
-            # Run the assistant
-            run = self.client.beta.threads.runs.create(
-                thread_id=thread_id,
-                assistant_id=self.assistant.id
+            # Stream the run, dispatching tool calls as soon as they are requested
+            run = stream_run(
+                self.client,
+                thread_id,
+                self.assistant.id,
+                on_requires_action=self.run_tool,
+                on_text_delta=on_text_delta,
+                name=self.name
             )
 
-            # Wait for completion
-            while True:
-                run = self.client.beta.threads.runs.retrieve(
-                    thread_id=thread_id,
-                    run_id=run.id
-                )
-
-                status = run.status
-                print(f"Run status for {self.name}: {status}")
-
-                if status == 'completed':
-                    break
-                elif status == 'incomplete':
-                    raise Exception(f"Status {status}. I encountered an error processing your request:\n{run.incomplete_details}")
-                elif status == 'failed':
-                    raise Exception(f"Status {status}. I encountered an error processing your request:\n{run.error}")
-                elif status == "requires_action" and run.required_action.type == 'submit_tool_outputs':
-                    self.run_tool(run, thread_id)
-
-                time.sleep(1)
+            status = run.status
+            if status == 'incomplete':
+                raise Exception(f"Status {status}. I encountered an error processing your request:\n{run.incomplete_details}")
+            elif status != 'completed':
+                raise Exception(f"Status {status}. I encountered an error processing your request:\n{run.error}")
 
-            # Get messages (newest first)
+            # Get the messages this run added
             messages = self.client.beta.threads.messages.list(
                 thread_id=thread_id,
-                order="asc"
+                order="asc",
+                run_id=run.id
             )
 
             self.print_messages(messages)
             response_text, attachments = self.parse_messages(messages)
+            self.history.add(user_id, content, response_text)
 
             # Add any attachments from the agent
             while self.agent_attachments:
@@ -292,14 +328,16 @@ class EmployeeOS(MessageHandler):
 
         except Exception as e:
             print(f"Error in {self.name} assistant response: {e}")
-            return f"Sorry, I encountered an error: {str(e)}"
+            return f"Sorry, I encountered an error: {str(e)}", []
 
     def reset_conversation(self, user_id: str):
         """Start a new thread for the user"""
-        if user_id in self.threads:
-            # Create new thread
-            thread = self.client.beta.threads.create()
-            self.threads[user_id] = thread.id
+        with self.user_lock(user_id):
+            if self.threads.get(user_id) is not None:
+                # Create new thread
+                thread = self.client.beta.threads.create()
+                self.threads.set(user_id, thread.id)
+                self.history.reset(user_id)
 
 
 if __name__ == "__main__":
@@ -4,12 +4,19 @@ import json
 import sys
 import regex as re
 import base64
+import threading
 
-from openai import OpenAI
-from dotenv import load_dotenv
 from typing import List, Dict
-from utils.imgur import file_upload as file_upload_imgur
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.artifacts import publish, still_published
 from utils.classes import File, Message, ApplicationMessage
+from utils.uploads import upload_files
+from utils.assistants import assistant_registry, merge_file_ids
+from utils.clients import load_env, openai_client
+from utils.cache import TTLCache
+from utils.budget import HistoryBudget
+from utils.sessions import SessionStore, SQLiteSessionStore
 from dataclasses import dataclass
 
 from agents.agent_autogen import Agent, File, MessageHandler
@@ -18,11 +25,9 @@ from tools.notion import tool_specs as tool_specs_notion, tool_maps as tool_maps
 from autogen.agentchat.contrib.gpt_assistant_agent import GPTAssistantAgent
 from autogen import ConversableAgent, UserProxyAgent
 
-from utils.delete import delete_assistants_and_files
-delete_assistants_and_files()
 
-load_dotenv('creds/.env', override=True)
-assistant_id = os.environ.get("ASSISTANT_ID", None)
+# OpenAI file ids as they appear in assistant responses
+FILE_ID_PATTERN = r'file-[A-Za-z0-9]+'
 
 # Wrapper for a user from an email address to use as the sender of msgs
 @dataclass
@@ -78,34 +83,71 @@ tool_spec_agent = [{
 
 
 class EmployeeOS(GPTAssistantAgent):
-    def __init__(self, agent):
+    def __init__(self, agent, session_store: SessionStore = None, max_active_sessions=256):
+        load_env()
+        assistant_id = os.environ.get("ASSISTANT_ID", None)
 
         name = "Employee"
 
+        model = "gpt-4o-mini"
+        instructions = f"""You are a generalist employee.
+                You have access to various communication tools like Notion and Slack.
+                When you receive communication from coworkers, they will begin with the application they were sent from.
+                You have access to an AI Analyst for any analytical work. Delegate any analytical work to them and summarize their work."""
+        tools = tool_spec_agent + tool_specs_notion
+
         llm_config = {
-            "model": "gpt-4o-mini",
+            "model": model,
             "api_key": os.getenv('OPENAI_API_KEY')
         }
 
+        # Reuse the registered assistant, updating it in place if its config changed
+        config = {"instructions": instructions, "tools": tools, "model": model}
+        registered_id, changed = assistant_registry.lookup_existing(openai_client(), name, config)
+
         assistant_config = {
-            "assistant_id": assistant_id,
-            "tools": tool_spec_agent + tool_specs_notion
+            "assistant_id": assistant_id or registered_id,
+            "tools": tools,
+            "overwrite_instructions": changed,
+            "overwrite_tools": changed
         }
 
         super().__init__(
             name=name,
-            instructions=f"""You are a generalist employee.
-                You have access to various communication tools like Notion and Slack.
-                When you receive communication from coworkers, they will begin with the application they were sent from.
-                You have access to an AI Analyst for any analytical work. Delegate any analytical work to them and summarize their work.""",
+            instructions=instructions,
             llm_config=llm_config,
             assistant_config=assistant_config,
             verbose=False)
 
+        # Use the shared pooled, rate limited client instead of the one autogen builds
+        self._openai_client = openai_client()
+
+        # autogen only overwrites instructions and tools of an existing assistant
+        if changed and assistant_config["assistant_id"]:
+            self._openai_assistant = self.openai_client.beta.assistants.update(self.assistant_id, model=model)
+
+        assistant_registry.register(name, self.assistant_id, config)
+
         self.agent = agent
         self.agent_attachments: List[str] = []
         self.user_messages = {}
 
+        # Conversations past the token budget restart from a summary
+        self.history = HistoryBudget(self.openai_client, model=model)
+
+        # Sender histories are persisted, only the most recently active ones stay loaded
+        self.sessions = session_store or SQLiteSessionStore("autogen_sessions", cache_size=0)
+        self.active_senders: OrderedDict = OrderedDict()
+        self.max_active_sessions = max_active_sessions
+
+        # Sessions, attachments and the analyst conversation are shared by every caller (e.g. the Slack
+        # worker pool and the Notion responder), so turns run one at a time
+        self.lock = threading.Lock()
+
+        # Artifacts in responses are downloaded and published concurrently, once per file id
+        self.artifact_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="artifacts")
+        self.artifact_urls = TTLCache(maxsize=4096)
+
         tool_maps_agent = {"chat_with_agent": self.chat_with_agent}
         self.register_function(function_map=tool_maps_agent | tool_maps_notion)
 
@@ -114,13 +156,7 @@ class EmployeeOS(GPTAssistantAgent):
         """Upload files to the assistant"""
         # If files are File objects, upload them
         if isinstance(files[0], File):
-            file_ids = []
-            for file in files:
-                uploaded_file = self.openai_client.files.create(
-                    file=file.content,
-                    purpose='assistants'
-                )
-                file_ids.append(uploaded_file.id)
+            file_ids = upload_files(self.openai_client, files)
 
         else:
             # Assume files are already uploaded
@@ -133,13 +169,14 @@ class EmployeeOS(GPTAssistantAgent):
         else:
             current_files = []
 
-        # Update the assistant's code interpreter with the new files
+        # Update the assistant's code interpreter with the new files. The assistant is reused
+        # across restarts, so the oldest files are dropped rather than hitting the file limit
         self._openai_assistant = self.openai_client.beta.assistants.update(
             assistant_id=self.openai_assistant.id,
             tools=self.openai_assistant.tools,
             tool_resources={
                 "code_interpreter": {
-                    "file_ids": current_files + file_ids
+                    "file_ids": merge_file_ids(current_files, file_ids)
                 }
             })
 
@@ -157,30 +194,60 @@ class EmployeeOS(GPTAssistantAgent):
             print(f"Error retrieving file {file_id}: {e}")
 
     def upload_file_public(self, file: File):
-        res = file_upload_imgur(file.content)
+        # Served from the local artifact store when it is configured, else re-hosted on Imgur
+        res = publish(file.content, os.path.splitext(file.name or "")[1] or None)
         file.url = res['url']
         file.id = res['id']
         return res
 
-    def parse_files_in_response(self, response, upload=True):
-        # Find all file ids in the response
-        ids = re.findall(r'file-[A-Za-z0-9]+', response)
-        files = []
-        file_map = {}
+    def publish_artifact(self, file_id, upload=True) -> File:
+        """Download a file the assistant produced and publish it, reusing the URL of a file seen before"""
+        published = self.artifact_urls.get(file_id)
+        if published and still_published(published):
+            return File(id=file_id, name=file_id, filetype="image", url=published['url'])
+
+        file = self.download_file(file_id)
+        if file and upload:
+            try:
+                self.upload_file_public(file)
+            except Exception as e:
+                print(f"Error publishing file {file_id}: {e}")
+                return None
+            self.artifact_urls.set(file_id, {"url": file.url, "id": file.id})
+        return file
+
+    def attach_files(self, file_ids: List[str]):
+        """Give the assistant's code interpreter the files it doesn't have yet"""
+        ci = self.openai_assistant.tool_resources.code_interpreter
+        current_files = set(ci.file_ids) if ci and ci.file_ids else set()
+
+        new_ids = [file_id for file_id in file_ids if file_id not in current_files]
+        if new_ids:
+            self.add_files(new_ids)
 
-        for file_id in ids:
-            file = self.download_file(file_id)
-            if upload: self.upload_file_public(file)
-            files.append(file)
-            file_map[file_id] = file.url
+    def parse_files_in_response(self, response, upload=True):
+        # Find the distinct file ids in the response, in order of appearance
+        ids = list(dict.fromkeys(re.findall(FILE_ID_PATTERN, response)))
+        if not ids:
+            return response
+
+        files = {
+            file_id: file
+            for file_id, file in zip(ids, self.artifact_pool.map(lambda file_id: self.publish_artifact(file_id, upload), ids))
+            if file
+        }
 
         if files:
-            # TODO: only add non-image files. For image files, respond with them in next response
-            agent_file_ids = self.add_files(files)
-            self.agent_attachments.extend(files)
+            # The files already live in OpenAI, so they are attached by id rather than uploaded again
+            self.attach_files(list(files))
+            self.agent_attachments.extend(files.values())
+
+        # Replace file ids with urls in the response, leaving any that couldn't be published
+        def replace(match):
+            file = files.get(match.group())
+            return file.url if file and file.url else match.group()
 
-        # Replace file ids with urls in the response
-        response = re.sub(r'file-[^\n]+', lambda x: file_map[x.group()], response)
+        response = re.sub(FILE_ID_PATTERN, replace, response)
 
         return response
 
@@ -217,6 +284,51 @@ class EmployeeOS(GPTAssistantAgent):
 
     #     return response
 
+    def load_session(self, sender: Sender):
+        """Make sure a sender's history and assistant thread are loaded, unloading the least recently active"""
+        if sender in self.active_senders:
+            self.active_senders.move_to_end(sender)
+            return
+
+        session = self.sessions.get(sender.name)
+        if session:
+            # Reattach to the sender's thread as is, without re-sending the history
+            self._oai_messages[sender] = session["messages"]
+            if session.get("thread_id"):
+                try:
+                    self._openai_threads[sender] = self.openai_client.beta.threads.retrieve(session["thread_id"])
+                    self._unread_index[sender] = session["unread_index"]
+                except Exception as e:
+                    print(f"Could not reload thread for {sender}, starting a new one: {e}")
+                    self._unread_index[sender] = 0
+
+        self.active_senders[sender] = True
+        while len(self.active_senders) > self.max_active_sessions:
+            evicted, _ = self.active_senders.popitem(last=False)
+            self.save_session(evicted)
+            self._oai_messages.pop(evicted, None)
+            self._openai_threads.pop(evicted, None)
+            self._unread_index.pop(evicted, None)
+
+    def save_session(self, sender: Sender):
+        thread = self._openai_threads.get(sender)
+        self.sessions.set(sender.name, {
+            "messages": self._oai_messages.get(sender, []),
+            "thread_id": thread.id if thread else None,
+            "unread_index": self._unread_index.get(sender, 0)
+        })
+
+    def compact_history(self, agent) -> str:
+        """If the conversation with `agent` is over budget, clear it (and its thread) and return its summary"""
+        messages = self.chat_messages[agent]
+        if not self.history.over_budget(messages=messages):
+            return None
+
+        seed = self.history.summarize(messages)
+        print(f"Rolled {len(messages)} messages with {agent} into a summary")
+        self.clear_history(agent)
+        return seed
+
     def chat_with_agent(self, text, image_urls=None, file_ids=None):
         if file_ids:
             print('Files sent to agent: ', file_ids)
@@ -226,6 +338,10 @@ class EmployeeOS(GPTAssistantAgent):
             print('No files sent to agent.')
             attachments = None
 
+        seed = self.compact_history(self.agent)
+        if seed:
+            text = f"{seed}\n\n{text}"
+
         if image_urls:
             content = [{"type": "text", "text": text}]
             for image_url in image_urls:
@@ -243,13 +359,17 @@ class EmployeeOS(GPTAssistantAgent):
             recipient=self.agent,
             message=message,
             max_turns=1,
-            clear_history=False)
+            clear_history=seed is not None)
 
         summary = self.parse_files_in_response(response.summary)
 
         return summary
 
     def handle_message(self, message: ApplicationMessage) -> tuple([str, List[File]]):
+        with self.lock:
+            return self._handle_message(message)
+
+    def _handle_message(self, message: ApplicationMessage) -> tuple([str, List[File]]):
         user = message.user
         text = message.text
         files = message.files
@@ -258,8 +378,15 @@ class EmployeeOS(GPTAssistantAgent):
         self.agent_attachments = [] # Clear attachments
 
         sender = Sender(name=user)
+        self.load_session(sender)
         text = f"Application: {application}\n" + text
 
+        seed = self.compact_history(sender)
+        if seed:
+            text = f"{seed}\n\n{text}"
+        if message.context:
+            text = f"{message.context}\n\n{text}"
+
         attachments = None
         if files:
             content = [{"type": "text", "text": text}]
@@ -292,6 +419,7 @@ class EmployeeOS(GPTAssistantAgent):
         self._process_received_message(message, sender, silent=False)
         response = self.generate_reply(messages=self.chat_messages[sender])
         self._append_oai_message(response, "assistant", sender, is_sending=True)
+        self.save_session(sender)
 
         return response['content'], self.agent_attachments
 
@@ -1,23 +1,20 @@
-import dotenv
 import os
 import requests
-import mistune
 from datetime import datetime, timedelta
 import threading
 import queue
 
 
-from notion_client import Client
-from agents.agent import MessageHandler
+from comms.base import MessageHandler
+from utils.clients import notion_client
 
 
-dotenv.load_dotenv('creds/.env')
-
 class NotionRenderer:
     def __init__(self):
         self.blocks = []
 
     def render(self, markdown_text):
+        import mistune
         markdown = mistune.create_markdown(renderer='ast')
         ast = markdown(markdown_text)
         self.blocks = self.process_nodes(ast)
@@ -167,11 +164,18 @@ renderer = NotionRenderer()
 
 class NotionBot():
     def __init__(self):
-        self.client = Client(auth=os.environ["NOTION_TOKEN"])
-        self.db_id = self.get_database_id()
+        self.client = notion_client()
+        self._db_id = None
 
         self._message_handler: MessageHandler = None
 
+    @property
+    def db_id(self):
+        # Looked up on first use, it costs a search call
+        if self._db_id is None:
+            self._db_id = self.get_database_id()
+        return self._db_id
+
     def get_database_id(self):
         # get the database id
         results = self.client.search(query="").get("results")
@@ -180,6 +184,7 @@ class NotionBot():
                 return result["id"]
 
     def markdown_to_notion_blocks(self, markdown_text):
+        import mistune
         markdown = mistune.create_markdown(renderer='ast')
         ast = markdown(markdown_text)
         blocks = self.process_nodes(ast)
@@ -296,11 +301,24 @@ tool_specs = [
     }
 ]
 
-notion_bot = NotionBot()
+_notion_bot = None
+
+def get_notion_bot() -> NotionBot:
+    """The shared NotionBot used by the tools, built on first use"""
+    global _notion_bot
+    if _notion_bot is None:
+        _notion_bot = NotionBot()
+    return _notion_bot
+
+def create_page(title, content=""):
+    return get_notion_bot().create_page(title, content)
+
+def update_block(block_id, content):
+    return get_notion_bot().update_block(block_id, content)
 
 tool_maps = {
-    "create_page": notion_bot.create_page,
-    "update_block": notion_bot.update_block
+    "create_page": create_page,
+    "update_block": update_block
 }
 
 if __name__ == "__main__":
@@ -313,4 +331,4 @@ The analysis of the uploaded CSV file has been completed, and I've generated a p
 If you need any further analysis or have additional questions, feel free to let me know!
 ![Product Categories Pie Chart](https://i.imgur.com/oLNji6e.png)"""
 
-    page = notion_bot.create_page(title, markdown_content)
\ No newline at end of file
+    page = create_page(title, markdown_content)
\ No newline at end of file
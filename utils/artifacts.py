@@ -0,0 +1,213 @@
+import os
+import re
+import hashlib
+import mimetypes
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.state import state_path
+
+# Artifacts are named by the SHA-256 of their content plus an optional extension
+ARTIFACT_NAME = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]{1,8})?$")
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 1024 * 1024
+
+# Generated charts arrive without a file name, so images are recognized by their signature
+SIGNATURES = {
+    b"\x89PNG": "png",
+    b"\xff\xd8\xff": "jpg",
+    b"GIF8": "gif",
+}
+
+def guess_extension(content):
+    header = bytes(content[:12])
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    for signature, extension in SIGNATURES.items():
+        if header.startswith(signature):
+            return extension
+    return None
+
+class ArtifactStore:
+    """Content-addressed files on local disk, served over HTTP at `base_url`.
+
+    Identical content is stored once, under a URL that never changes. Past `max_bytes` the
+    least recently stored or republished artifacts are deleted first.
+    """
+
+    def __init__(self, root=None, base_url=None, max_bytes=None):
+        self.root = root or state_path("artifacts")
+        self.base_url = (base_url or os.getenv("ARTIFACT_BASE_URL", "")).rstrip("/")
+        self.max_bytes = max_bytes or int(os.getenv("ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024))
+        self.lock = threading.Lock()
+
+        os.makedirs(self.root, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.root) if entry.is_file())
+
+    def path(self, name):
+        if not ARTIFACT_NAME.match(name):
+            raise ValueError(f"Invalid artifact name: {name}")
+        return os.path.join(self.root, name)
+
+    def url(self, name):
+        return f"{self.base_url}/artifacts/{name}"
+
+    def put(self, content, extension=None) -> dict:
+        """Store bytes (or any bytes-like buffer) and return {'url', 'id'} like the Imgur upload"""
+        digest = hashlib.sha256(content).hexdigest()
+        extension = extension or guess_extension(content)
+        name = digest + (f".{extension.lstrip('.')}" if extension else "")
+        path = self.path(name)
+
+        with self.lock:
+            if os.path.exists(path):
+                # Mark as recently used
+                os.utime(path)
+            else:
+                # Write to a temporary file first so the server never sees a partial artifact
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, path)
+                self.size += len(content)
+
+        if self.size > self.max_bytes:
+            self.evict()
+
+        return {"url": self.url(name), "id": name}
+
+    def touch(self, name) -> bool:
+        """Mark an artifact as recently used. Returns False if it was evicted"""
+        with self.lock:
+            try:
+                os.utime(self.path(name))
+                return True
+            except (ValueError, OSError):
+                return False
+
+    def evict(self):
+        """Delete the least recently used artifacts until the store is under 90% of `max_bytes`"""
+        with self.lock:
+            entries = sorted(
+                (entry for entry in os.scandir(self.root) if entry.is_file() and ARTIFACT_NAME.match(entry.name)),
+                key=lambda entry: entry.stat().st_mtime
+            )
+            deleted = 0
+            for entry in entries:
+                if self.size <= self.max_bytes * 0.9:
+                    break
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.size -= size
+                deleted += 1
+
+        print(f"Evicted {deleted} artifacts, {self.size} bytes stored")
+
+    def serve(self, port=8081):
+        """Serve artifacts with range requests and long-lived caching, since content never changes"""
+        store = self
+
+        class ArtifactHandler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.send_artifact(body=False)
+
+            def do_GET(self):
+                self.send_artifact(body=True)
+
+            def send_artifact(self, body):
+                name = self.path.split("?")[0].removeprefix("/artifacts/")
+                try:
+                    path = store.path(name)
+                    size = os.path.getsize(path)
+                except (ValueError, OSError):
+                    self.send_error(404)
+                    return
+
+                etag = f'"{name.split(".")[0]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+
+                start, end = 0, size - 1
+                match = RANGE.match(self.headers.get("Range", ""))
+                if match and match.group(1) + match.group(2):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        start = max(size - int(match.group(2)), 0)
+
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.end_headers()
+                        return
+
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                else:
+                    self.send_response(200)
+
+                self.send_header("Content-Type", mimetypes.guess_type(name)[0] or "application/octet-stream")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+                self.end_headers()
+
+                if not body:
+                    return
+
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = f.read(min(CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        remaining -= len(chunk)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("", port), ArtifactHandler)
+        print(f"Serving artifacts on port {port} at {store.base_url}")
+        server.serve_forever()
+
+_artifact_store = None
+_artifact_store_lock = threading.Lock()
+
+def get_artifact_store() -> ArtifactStore:
+    global _artifact_store
+    with _artifact_store_lock:
+        if _artifact_store is None:
+            _artifact_store = ArtifactStore()
+        return _artifact_store
+
+def artifacts_enabled() -> bool:
+    """Artifacts are only served locally when a public URL for the server is configured"""
+    return bool(os.getenv("ARTIFACT_BASE_URL"))
+
+def start_artifact_server(port=None):
+    port = port or int(os.getenv("ARTIFACT_PORT", 8081))
+    server_thread = threading.Thread(target=get_artifact_store().serve, args=(port,))
+    server_thread.daemon = True
+    server_thread.start()
+    return server_thread
+
+def still_published(published: dict) -> bool:
+    """Whether a result of `publish` is still reachable, marking local artifacts as recently used"""
+    if artifacts_enabled() and ARTIFACT_NAME.match(published.get("id") or ""):
+        return get_artifact_store().touch(published["id"])
+    return True
+
+def publish(content, extension=None) -> dict:
+    """Make bytes reachable at a public URL: from the local artifact server if configured, else via Imgur"""
+    if artifacts_enabled():
+        return get_artifact_store().put(content, extension)
+
+    from utils.imgur import file_upload
+    return file_upload(content)
@@ -0,0 +1,81 @@
+import json
+import hashlib
+import threading
+
+from utils.state import load_json, save_json
+from utils.ratelimit import status_code
+
+REGISTRY_FILE = "assistants.json"
+
+# Code interpreter accepts at most this many files per assistant
+MAX_CODE_INTERPRETER_FILES = 20
+
+def merge_file_ids(current, new):
+    """Attached file ids plus `new` ones, without duplicates, dropping the oldest past the limit"""
+    file_ids = [file_id for file_id in current if file_id not in new] + list(dict.fromkeys(new))
+    return file_ids[-MAX_CODE_INTERPRETER_FILES:]
+
+def config_hash(config) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+class AssistantRegistry:
+    """Remembers the assistant created for each name and the hash of the config it was created with,
+    so restarts reuse assistants instead of creating new ones"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def lookup(self, name, config):
+        """Return (assistant_id, changed) for a registered name, or (None, True)"""
+        entry = load_json(REGISTRY_FILE, default={}).get(name)
+        if not entry:
+            return None, True
+        return entry["id"], entry["hash"] != config_hash(config)
+
+    def lookup_existing(self, client, name, config):
+        """Like `lookup`, but returns (None, True) if the registered assistant was deleted"""
+        assistant_id, changed = self.lookup(name, config)
+        if assistant_id:
+            try:
+                client.beta.assistants.retrieve(assistant_id)
+            except Exception as e:
+                if status_code(e) != 404:
+                    raise
+                print(f"Registered assistant {name} ({assistant_id}) no longer exists, creating a new one")
+                return None, True
+        return assistant_id, changed
+
+    def register(self, name, assistant_id, config):
+        with self.lock:
+            registry = load_json(REGISTRY_FILE, default={})
+            registry[name] = {"id": assistant_id, "hash": config_hash(config)}
+            save_json(REGISTRY_FILE, registry)
+
+    def ids(self) -> set:
+        return {entry["id"] for entry in load_json(REGISTRY_FILE, default={}).values()}
+
+    def get_or_create(self, client, name, **config):
+        """Reuse the registered assistant if its config is unchanged, update it in place if it changed,
+        and create it if there is none (or it no longer exists)"""
+        assistant_id, changed = self.lookup(name, config)
+
+        if assistant_id:
+            try:
+                if changed:
+                    print(f"Updating assistant {name} ({assistant_id}) with new config")
+                    assistant = client.beta.assistants.update(assistant_id, name=name, **config)
+                    self.register(name, assistant.id, config)
+                    return assistant
+
+                return client.beta.assistants.retrieve(assistant_id)
+            except Exception as e:
+                # Anything but a deleted assistant (e.g. an outage) must not create a duplicate
+                if status_code(e) != 404:
+                    raise
+                print(f"Registered assistant {name} ({assistant_id}) no longer exists, creating a new one")
+
+        assistant = client.beta.assistants.create(name=name, **config)
+        self.register(name, assistant.id, config)
+        return assistant
+
+assistant_registry = AssistantRegistry()
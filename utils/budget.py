@@ -0,0 +1,126 @@
+import os
+import threading
+
+from typing import List
+from utils.sessions import SessionStore, MemorySessionStore
+
+SUMMARY_PROMPT = """Summarize the conversation below so it can continue in a fresh thread.
+Keep names, decisions, open questions, file IDs and any numbers the user may refer back to.
+Write it as compact notes, not prose."""
+
+# Images cost a roughly fixed number of tokens regardless of their size
+IMAGE_TOKENS = 85
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+def count_tokens(text: str) -> int:
+    """Token count of `text`, exact if tiktoken is installed and estimated (~4 characters per token) otherwise"""
+    global _encoding
+    if not text:
+        return 0
+
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except ImportError:
+                _encoding = False
+
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def message_text(message) -> str:
+    """Text of a chat message dict or an Assistants API message, with images left out"""
+    content = message.get("content") if isinstance(message, dict) else message.content
+    if content is None or isinstance(content, str):
+        return content or ""
+
+    parts = []
+    for part in content:
+        if isinstance(part, dict):
+            if part.get("type") == "text":
+                parts.append(part["text"] if isinstance(part["text"], str) else part["text"].get("value", ""))
+        elif part.type == "text":
+            parts.append(part.text.value)
+    return "\n".join(parts)
+
+def message_role(message) -> str:
+    return message.get("role", "user") if isinstance(message, dict) else message.role
+
+def message_tokens(message) -> int:
+    content = message.get("content") if isinstance(message, dict) else message.content
+    images = 0
+    if isinstance(content, list):
+        images = sum(1 for part in content if (part.get("type") if isinstance(part, dict) else part.type) != "text")
+    return count_tokens(message_text(message)) + images * IMAGE_TOKENS + MESSAGE_OVERHEAD_TOKENS
+
+class HistoryBudget:
+    """Keeps a conversation under `max_tokens` by rolling older turns into a summary.
+
+    Callers add the tokens of each turn with `add(session, ...)`; once a session is over budget,
+    `summarize(messages)` condenses its history into a seed message for a fresh thread, which
+    also carries the last `keep_recent` messages verbatim. Counts are kept in `store`.
+    """
+
+    def __init__(self, client, max_tokens=None, keep_recent=4, model="gpt-4o-mini", store: SessionStore = None):
+        self.client = client
+        self.max_tokens = max_tokens or int(os.getenv("HISTORY_TOKEN_BUDGET", "16000"))
+        self.keep_recent = keep_recent
+        self.model = model
+        self.tokens = store or MemorySessionStore()
+        self.lock = threading.Lock()
+
+    def add(self, session, *texts) -> int:
+        """Count `texts` towards a session and return its new total"""
+        with self.lock:
+            total = self.tokens.get(session, 0) + sum(count_tokens(text) for text in texts)
+            self.tokens.set(session, total)
+            return total
+
+    def over_budget(self, session=None, messages=None) -> bool:
+        """Whether a tracked session, or a list of messages, is past the budget"""
+        if messages is not None:
+            return sum(message_tokens(message) for message in messages) > self.max_tokens
+        with self.lock:
+            return self.tokens.get(session, 0) > self.max_tokens
+
+    def reset(self, session, tokens=0):
+        with self.lock:
+            self.tokens.set(session, tokens)
+
+    def summarize(self, messages: List) -> str:
+        """Seed text for a new thread: a summary of `messages` followed by the most recent ones"""
+        split = max(len(messages) - self.keep_recent, 0)
+        older, recent = messages[:split], messages[split:]
+
+        seed = "<log start> Summary of the conversation so far:\n"
+        if older:
+            transcript = "\n\n".join(f"{message_role(message)}: {message_text(message)}" for message in older)
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {"role": "user", "content": transcript}
+                ]
+            )
+            seed += response.choices[0].message.content
+        if recent:
+            seed += "\n\nMost recent messages:\n" + "\n\n".join(
+                f"{message_role(message)}: {message_text(message)}" for message in recent
+            )
+        return seed + " <log end>"
+
+    def roll_over_thread(self, session, thread_id) -> str:
+        """Replace an Assistants API thread with a new one seeded with its summary. Returns the new thread id"""
+        # Iterating the page fetches every following page
+        messages = list(self.client.beta.threads.messages.list(thread_id=thread_id, order="asc", limit=100))
+        seed = self.summarize(messages)
+
+        thread = self.client.beta.threads.create(messages=[{"role": "user", "content": seed}])
+        self.reset(session, count_tokens(seed))
+        print(f"Rolled {len(messages)} messages of thread {thread_id} into a summary on thread {thread.id}")
+        return thread.id
@@ -17,4 +17,6 @@ class Message:
 @dataclass
 class ApplicationMessage(Message):
     user: Optional[str] = None
-    application: Optional[str] = None
\ No newline at end of file
+    application: Optional[str] = None
+    # Earlier messages of the conversation the message was posted in, if the application has them
+    context: Optional[str] = None
\ No newline at end of file
@@ -0,0 +1,115 @@
+import os
+import atexit
+import threading
+
+# Clients are built on first use so importing a module never loads credentials,
+# opens connections or imports heavy SDKs
+_lock = threading.RLock()
+_clients = {}
+_env_loaded = False
+
+# Connection pool and timeout defaults shared by every HTTP client in the process
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+KEEPALIVE_EXPIRY = 60
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 60
+MAX_RETRIES = 3
+
+def load_env():
+    """Load credentials from creds/.env once per process"""
+    global _env_loaded
+    with _lock:
+        if not _env_loaded:
+            from dotenv import load_dotenv
+            load_dotenv('creds/.env', override=True)
+            _env_loaded = True
+
+def get_client(name, factory):
+    """Return the process-wide client registered under `name`, building it with `factory()` on first use"""
+    with _lock:
+        if name not in _clients:
+            load_env()
+            _clients[name] = factory()
+        return _clients[name]
+
+def close_clients():
+    """Close every client built so far, releasing their pooled connections"""
+    with _lock:
+        for client in _clients.values():
+            # Rate limited clients are closed directly, not through their service
+            close = getattr(getattr(client, "_target", client), "close", None)
+            if close:
+                close()
+        _clients.clear()
+
+atexit.register(close_clients)
+
+def _httpx_client():
+    # Each SDK configures base URL and headers on its own httpx client, so they can't share one
+    import httpx
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=POOL_MAXSIZE,
+            max_keepalive_connections=POOL_MAXSIZE,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    )
+
+def http_session():
+    """Return the shared requests session for plain HTTP calls (file downloads, Imgur, webhooks).
+
+    Requests without an explicit timeout get (CONNECT_TIMEOUT, READ_TIMEOUT), and idempotent
+    requests are retried on connection errors and 429/5xx responses, honouring Retry-After.
+    """
+    def build():
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        class TimeoutHTTPAdapter(HTTPAdapter):
+            def send(self, request, **kwargs):
+                if kwargs.get("timeout") is None:
+                    kwargs["timeout"] = (CONNECT_TIMEOUT, READ_TIMEOUT)
+                return super().send(request, **kwargs)
+
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            raise_on_status=False
+        )
+        adapter = TimeoutHTTPAdapter(pool_connections=16, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+    return get_client("http", build)
+
+def openai_client():
+    def build():
+        from openai import OpenAI
+        from utils.ratelimit import rate_limited
+
+        # Retries are left to the rate limit layer so throttling is counted in one place
+        client = OpenAI(
+            api_key=os.getenv('OPENAI_API_KEY'),
+            http_client=_httpx_client(),
+            max_retries=0
+        )
+        return rate_limited(client, "openai")
+    return get_client("openai", build)
+
+def notion_client():
+    def build():
+        from notion_client import Client
+        from utils.ratelimit import rate_limited
+
+        client = Client(
+            auth=os.environ["NOTION_TOKEN"],
+            client=_httpx_client(),
+            timeout_ms=READ_TIMEOUT * 1000
+        )
+        return rate_limited(client, "notion")
+    return get_client("notion", build)
@@ -0,0 +1,85 @@
+import time
+import sqlite3
+import threading
+
+from typing import Protocol
+from utils.cache import TTLCache
+from utils.state import state_path
+
+class DedupStore(Protocol):
+    """Remembers which keys (e.g. comment ids) have already been processed"""
+    def __contains__(self, key) -> bool:
+        pass
+
+    def add(self, key):
+        pass
+
+class MemoryDedupStore:
+    """Bounded in-memory store. Keys are forgotten after `ttl` seconds or when evicted"""
+
+    def __init__(self, maxsize=10000, ttl=30 * 24 * 60 * 60):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def add(self, key):
+        self.cache.set(key, True)
+
+class SQLiteDedupStore:
+    """Persistent store in SQLite with an in-memory LRU/TTL front for hot keys.
+
+    Rows older than `ttl` seconds are compacted away every `compact_every` adds.
+    """
+
+    def __init__(self, name, path=None, ttl=30 * 24 * 60 * 60, cache_size=10000, compact_every=1000):
+        self.table = name
+        self.ttl = ttl
+        self.compact_every = compact_every
+        self.adds = 0
+
+        self.front = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or state_path("dedup.db"), check_same_thread=False)
+
+        with self.lock, self.db:
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, added_at REAL NOT NULL)")
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_added_at ON {self.table} (added_at)")
+
+        self.compact()
+
+    def __contains__(self, key):
+        if key in self.front:
+            return True
+
+        with self.lock:
+            row = self.db.execute(
+                f"SELECT added_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+        if row is None or row[0] < time.time() - self.ttl:
+            return False
+
+        self.front.set(key, True)
+        return True
+
+    def add(self, key):
+        self.front.set(key, True)
+        with self.lock, self.db:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, added_at) VALUES (?, ?)", (key, time.time())
+            )
+            self.adds += 1
+
+        if self.adds % self.compact_every == 0:
+            self.compact()
+
+    def compact(self):
+        """Drop keys older than the ttl"""
+        with self.lock, self.db:
+            deleted = self.db.execute(
+                f"DELETE FROM {self.table} WHERE added_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+        if deleted:
+            print(f"Compacted {deleted} keys from {self.table}")
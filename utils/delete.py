@@ -1,37 +1,137 @@
-# Script to bulk delete assistants and files from OpenAI
-from openai import OpenAI
-from dotenv import load_dotenv
+# Script to bulk delete assistants and files from OpenAI. Run from the repo root: python -m utils.delete --help
 import os
+import time
+import fnmatch
+import argparse
+import threading
 
-load_dotenv('creds/.env', override=True)
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.uploads import upload_cache
+from utils.assistants import assistant_registry
+from utils.ratelimit import status_code
+from utils.clients import openai_client
 
-client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+ASSISTANT_NAMES = ["AI Analyst", "Employee"]
+FILE_PURPOSES = ["assistants", "assistants_output"]
 
-def delete_assistants():
-    # List all assistants of certain names
-    names = ["AI Analyst", "Employee"]
-    while assistants := [assistant for assistant in client.beta.assistants.list(limit=100).data if assistant.name in names]:
-        # delete all assistants with name "AI Analyst" in backwards order
-        for assistant in reversed(assistants):
+def is_older(item, older_than):
+    """Whether an item was created more than `older_than` seconds ago (always true if None)"""
+    return older_than is None or item.created_at < time.time() - older_than
+
+def reap(items, delete_fn, kind, dry_run=False, max_workers=8, on_deleted=None):
+    """Delete items concurrently on a bounded pool (the shared client backs off on rate limits). Returns the number deleted"""
+    if dry_run:
+        for item in items:
+            print(f"Would delete {kind}: {item.id}")
+        return 0
+
+    def delete(item):
+        try:
+            delete_fn(item.id)
+        except Exception as e:
+            # Already gone counts as deleted
+            if status_code(e) != 404:
+                raise
+        if on_deleted:
+            on_deleted(item)
+        return item
+
+    deleted = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(delete, item) for item in items]
+        for future in as_completed(futures):
             try:
-                client.beta.assistants.delete(assistant.id)
-                print(f"Deleted assistant: {assistant.id}")
+                future.result()
+                deleted += 1
+                if deleted % 50 == 0:
+                    print(f"Deleted {deleted}/{len(items)} {kind}s")
             except Exception as e:
-                print(f"Failed to delete assistant: {str(e)}")
+                print(f"Failed to delete {kind}: {str(e)}")
+
+    print(f"Deleted {deleted}/{len(items)} {kind}s")
+    return deleted
+
+def delete_assistants(names=ASSISTANT_NAMES, older_than=None, dry_run=False, max_workers=8):
+    client = openai_client()
+
+    # Registered assistants are reused across restarts, keep them
+    keep = assistant_registry.ids()
+
+    # Iterating the page fetches every following page
+    assistants = [
+        assistant for assistant in client.beta.assistants.list(limit=100)
+        if assistant.name in names and assistant.id not in keep and is_older(assistant, older_than)
+    ]
+
+    return reap(assistants, client.beta.assistants.delete, "assistant", dry_run=dry_run, max_workers=max_workers)
+
+def attached_file_ids(client) -> set:
+    """Ids of the files attached to the registered assistants' code interpreters"""
+    file_ids = set()
+    for assistant_id in assistant_registry.ids():
+        try:
+            assistant = client.beta.assistants.retrieve(assistant_id)
+        except Exception as e:
+            if status_code(e) == 404:
+                continue
+            raise
 
-def delete_files():
-    # List all files
-    files = client.files.list(purpose='assistants').data
-    files_output = client.files.list(purpose='assistants_output').data
+        ci = assistant.tool_resources.code_interpreter if assistant.tool_resources else None
+        if ci and ci.file_ids:
+            file_ids.update(ci.file_ids)
+    return file_ids
 
-    # delete all files
-    for file in reversed(files + files_output):
-        client.files.delete(file.id)
-        print(f"Deleted file: {file.id}")
+def delete_files(name_pattern=None, older_than=None, purposes=FILE_PURPOSES, dry_run=False, max_workers=8):
+    client = openai_client()
 
-def delete_assistants_and_files():
-    delete_assistants()
-    delete_files()
+    # Files the registered (kept) assistants still use are kept too
+    keep = attached_file_ids(client)
+
+    files = [
+        file
+        for purpose in purposes
+        for file in client.files.list(purpose=purpose)
+        if file.id not in keep
+        and is_older(file, older_than)
+        and (not name_pattern or fnmatch.fnmatch(file.filename or "", name_pattern))
+    ]
+
+    return reap(
+        files,
+        client.files.delete,
+        "file",
+        dry_run=dry_run,
+        max_workers=max_workers,
+        on_deleted=lambda file: upload_cache.forget(file.id)
+    )
+
+def delete_assistants_and_files(older_than=None, dry_run=False, max_workers=8):
+    delete_assistants(older_than=older_than, dry_run=dry_run, max_workers=max_workers)
+    delete_files(older_than=older_than, dry_run=dry_run, max_workers=max_workers)
+
+def start_reaper(interval=24 * 60 * 60, **kwargs) -> threading.Thread:
+    """Run delete_assistants_and_files every `interval` seconds in a background thread"""
+    def run():
+        while True:
+            try:
+                delete_assistants_and_files(**kwargs)
+            except Exception as e:
+                print(f"Reaper failed: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, daemon=True, name="reaper")
+    thread.start()
+    return thread
 
 if __name__ == "__main__":
-    delete_assistants_and_files()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Bulk delete assistants and files from OpenAI")
+    parser.add_argument("--older-than-hours", type=float, default=None, help="Only delete items older than this")
+    parser.add_argument("--names", nargs="+", default=ASSISTANT_NAMES, help="Assistant names to delete")
+    parser.add_argument("--files", default=None, help="Only delete files whose filename matches this glob")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent deletes")
+    parser.add_argument("--dry-run", action="store_true", help="List what would be deleted")
+    args = parser.parse_args()
+
+    older_than = args.older_than_hours * 60 * 60 if args.older_than_hours is not None else None
+    delete_assistants(names=args.names, older_than=older_than, dry_run=args.dry_run, max_workers=args.workers)
+    delete_files(name_pattern=args.files, older_than=older_than, dry_run=args.dry_run, max_workers=args.workers)
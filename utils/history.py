@@ -0,0 +1,128 @@
+import threading
+
+from collections import OrderedDict, deque
+from typing import Dict, List
+
+class RingBuffer:
+    """Last `maxlen` messages of a conversation in timestamp order, indexed by `ts`"""
+
+    def __init__(self, maxlen):
+        self.messages = deque(maxlen=maxlen)
+        self.by_ts: Dict[str, Dict] = {}
+
+    def append(self, message):
+        ts = message.get("ts")
+        if ts in self.by_ts:
+            return
+
+        if len(self.messages) == self.messages.maxlen:
+            self.by_ts.pop(self.messages[0].get("ts"), None)
+        self.messages.append(message)
+        self.by_ts[ts] = message
+
+    def merge(self, messages):
+        """Merge older messages (e.g. a backfill) in, keeping the newest `maxlen` overall"""
+        merged = {message.get("ts"): message for message in messages}
+        merged.update(self.by_ts)
+        newest = sorted(merged.values(), key=lambda message: float(message.get("ts", 0)))[-self.messages.maxlen:]
+
+        self.messages.clear()
+        self.by_ts.clear()
+        for message in newest:
+            self.append(message)
+
+    def update(self, message):
+        if message.get("ts") in self.by_ts:
+            self.by_ts[message["ts"]].update(message)
+
+    def remove(self, ts):
+        message = self.by_ts.pop(ts, None)
+        if message is not None:
+            self.messages.remove(message)
+
+    def __iter__(self):
+        return iter(list(self.messages))
+
+    def __len__(self):
+        return len(self.messages)
+
+class ConversationHistory:
+    """Thread-safe recent-message cache per channel and per thread, fed from message events.
+
+    Channel buffers hold top-level messages, thread buffers hold a thread's parent and replies.
+    Conversations are marked as backfilled once their history has been fetched, so the API is
+    asked at most once per conversation. The least recently active threads are dropped past `max_threads`.
+    """
+
+    def __init__(self, channel_size=50, thread_size=100, max_threads=1024):
+        self.channel_size = channel_size
+        self.thread_size = thread_size
+        self.max_threads = max_threads
+        self.channels: Dict[str, RingBuffer] = {}
+        self.threads: "OrderedDict[tuple, RingBuffer]" = OrderedDict()
+        self.backfilled = set()
+        self.lock = threading.Lock()
+
+    def _channel(self, channel):
+        if channel not in self.channels:
+            self.channels[channel] = RingBuffer(self.channel_size)
+        return self.channels[channel]
+
+    def _thread(self, channel, thread_ts):
+        key = (channel, thread_ts)
+        if key not in self.threads:
+            self.threads[key] = RingBuffer(self.thread_size)
+            if len(self.threads) > self.max_threads:
+                evicted, _ = self.threads.popitem(last=False)
+                self.backfilled.discard(evicted)
+        self.threads.move_to_end(key)
+        return self.threads[key]
+
+    def add_event(self, event):
+        """Record a `message` event, including edits and deletions"""
+        channel = event.get("channel")
+        subtype = event.get("subtype")
+
+        with self.lock:
+            if subtype == "message_changed":
+                message = event.get("message", {})
+                self._channel(channel).update(message)
+                if message.get("thread_ts"):
+                    self._thread(channel, message["thread_ts"]).update(message)
+            elif subtype == "message_deleted":
+                previous = event.get("previous_message", {})
+                self._channel(channel).remove(event.get("deleted_ts"))
+                if previous.get("thread_ts"):
+                    self._thread(channel, previous["thread_ts"]).remove(event.get("deleted_ts"))
+            else:
+                self._add(channel, event)
+
+    def _add(self, channel, message):
+        thread_ts = message.get("thread_ts")
+        if not thread_ts or thread_ts == message.get("ts"):
+            self._channel(channel).append(message)
+        if thread_ts:
+            self._thread(channel, thread_ts).append(message)
+
+    def needs_backfill(self, channel, thread_ts=None) -> bool:
+        with self.lock:
+            return (channel, thread_ts) not in self.backfilled
+
+    def backfill(self, channel, messages, thread_ts=None):
+        """Merge messages fetched from the API into a conversation and mark it backfilled"""
+        with self.lock:
+            if thread_ts:
+                self._thread(channel, thread_ts).merge(messages)
+            else:
+                self._channel(channel).merge(
+                    [message for message in messages if message.get("thread_ts") in (None, message.get("ts"))]
+                )
+            self.backfilled.add((channel, thread_ts))
+
+    def channel_messages(self, channel) -> List[Dict]:
+        with self.lock:
+            return list(self.channels.get(channel, []))
+
+    def thread_messages(self, channel, thread_ts) -> List[Dict]:
+        with self.lock:
+            return list(self.threads.get((channel, thread_ts), []))
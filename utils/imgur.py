@@ -1,12 +1,12 @@
-import requests
 import base64
 import os
 
-from dotenv import load_dotenv
-
-load_dotenv('creds/.env', override=True)
+from utils.clients import load_env, http_session
+from utils.ratelimit import get_service
 
 def file_upload(image_bytes):
+    load_env()
+
     # Imgur API endpoint
     url = "https://api.imgur.com/3/image"
 
@@ -15,19 +15,26 @@ def file_upload(image_bytes):
         'Authorization': f'Client-ID {os.environ.get("IMGUR_CLIENT_ID")}'
     }
 
-    # Convert bytes to base64 if needed
-    if isinstance(image_bytes, bytes):
+    # Convert bytes (or any bytes-like buffer, e.g. a memory-mapped file) to base64 if needed
+    if isinstance(image_bytes, str):
+        image_b64 = image_bytes
+    else:
         image_b64 = base64.b64encode(image_bytes).decode('utf-8')
 
-    # Post the image
-    response = requests.post(
-        url,
-        headers=headers,
-        data={
-            'image': image_b64,
-            'type': 'base64'
-        }
-    )
+    def post():
+        response = http_session().post(
+            url,
+            headers=headers,
+            data={
+                'image': image_b64,
+                'type': 'base64'
+            }
+        )
+        response.raise_for_status()
+        return response
+
+    # Post the image, backing off when Imgur throttles us
+    response = get_service("imgur").call(post, idempotent=False)
 
     # Get the URL from response
     response_data = response.json()['data']
@@ -0,0 +1,345 @@
+import os
+import re
+import time
+import random
+import asyncio
+import inspect
+import threading
+
+from collections import Counter
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` calls per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if one is available, otherwise return the seconds until one will be"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """Block until a token is available. Returns the seconds spent waiting"""
+        waited = 0
+        while wait := self._take():
+            time.sleep(wait)
+            waited += wait
+        return waited
+
+    async def acquire_async(self):
+        """Wait for a token without blocking the event loop. Returns the seconds spent waiting"""
+        waited = 0
+        while wait := self._take():
+            await asyncio.sleep(wait)
+            waited += wait
+        return waited
+
+def status_code(error):
+    """HTTP status of an API client exception, if it has one"""
+    for obj in (error, getattr(error, "response", None)):
+        for attr in ("status", "status_code"):
+            value = getattr(obj, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+def retry_after(error):
+    """Seconds to wait according to the Retry-After header of an API client exception"""
+    for obj in (error, getattr(error, "response", None)):
+        headers = getattr(obj, "headers", None)
+        if not headers:
+            continue
+
+        # Header casing differs between clients, and slack_sdk stores lists of values
+        for name, value in headers.items():
+            if name.lower() == "retry-after":
+                if isinstance(value, list):
+                    value = value[0] if value else None
+                try:
+                    return float(value)
+                except (TypeError, ValueError):
+                    return None
+    return None
+
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+def is_connect_error(error):
+    """Whether a call failed before a connection was made, so the server never saw the request"""
+    names = [cls.__name__ for cls in type(error).__mro__]
+    return any("ConnectError" in name or "ConnectTimeout" in name or "NewConnectionError" in name for name in names)
+
+def is_transient(error, idempotent=True):
+    """Whether a failed call is worth retrying: throttling, server errors, timeouts and dropped connections.
+
+    A write that may have reached the server (a timeout, a 5xx) would be applied twice,
+    so non-idempotent calls are only retried when throttled or when they never got through.
+    """
+    status = status_code(error)
+    if not idempotent:
+        return status == 429 or (status is None and is_connect_error(error))
+
+    if status is not None:
+        return status in TRANSIENT_STATUSES
+
+    names = [cls.__name__ for cls in type(error).__mro__]
+    return any("Timeout" in name or "Connection" in name for name in names)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a service whose circuit breaker is open"""
+
+class CircuitBreaker:
+    """Stops calling a service after `threshold` consecutive transient failures.
+
+    After `reset_timeout` seconds one trial call is let through; its outcome closes the
+    circuit again or keeps it open for another `reset_timeout`.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Whether a call may go ahead right now"""
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        """Count a transient failure. Returns True if this opened the circuit"""
+        with self.lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if was_open or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+            return not was_open and self.opened_at is not None
+
+class Service:
+    """Rate limit, retry and circuit breaker policy for calls to one external API.
+
+    `call` waits on the service's token bucket, retries transient failures with jittered
+    exponential backoff (or the server's Retry-After), and counts what happened in `metrics`.
+    """
+
+    def __init__(self, name, rate, capacity=None, retries=5, base_delay=1.0, max_delay=60.0,
+                 breaker: CircuitBreaker = None):
+        self.name = name
+        self.bucket = TokenBucket(rate, capacity)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = Counter()
+        self.metrics_lock = threading.Lock()
+
+    def count(self, metric, value=1):
+        with self.metrics_lock:
+            self.metrics[metric] += value
+
+    def _before_call(self):
+        if not self.breaker.allow():
+            self.count("rejected")
+            raise CircuitOpenError(f"{self.name} circuit is open after repeated failures")
+        self.count("calls")
+
+    def _after_failure(self, error, attempt, idempotent=True):
+        """Record a failed attempt and return the delay before retrying, or None to give up"""
+        if not is_transient(error):
+            # The service answered, it just didn't like the request
+            self.breaker.record_success()
+            return None
+
+        if not is_transient(error, idempotent):
+            # Worth retrying as a read, but a write may already have been applied
+            self.count("failures")
+            self.breaker.record_failure()
+            return None
+
+        if status_code(error) == 429:
+            self.count("throttled")
+
+        if attempt == self.retries:
+            self.count("failures")
+            if self.breaker.record_failure():
+                self.count("circuit_opened")
+                print(f"{self.name} circuit opened after {self.breaker.failures} consecutive failures")
+            return None
+
+        self.count("retries")
+        delay = retry_after(error) or min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random())
+        print(f"{self.name} call failed ({status_code(error) or type(error).__name__}), "
+              f"retrying in {delay:.1f}s (attempt {attempt + 1}/{self.retries})")
+        return delay
+
+    def call(self, fn, *args, idempotent=True, **kwargs):
+        """Call `fn` under this service's policy. Pass `idempotent=False` for writes that must not be repeated"""
+        for attempt in range(self.retries + 1):
+            self._before_call()
+            self.count("wait_seconds", self.bucket.acquire())
+
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt, idempotent)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    async def call_async(self, fn, *args, idempotent=True, **kwargs):
+        for attempt in range(self.retries + 1):
+            self._before_call()
+            self.count("wait_seconds", await self.bucket.acquire_async())
+
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt, idempotent)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+# Requests per second (and burst) for each provider, overridable with RATE_LIMIT_<NAME>
+SERVICE_LIMITS = {
+    "notion": (3, 3),
+    "slack": (5, 10),
+    "openai": (20, 40),
+    "imgur": (1, 5),
+}
+
+_services = {}
+_services_lock = threading.Lock()
+
+def get_service(name, **kwargs) -> Service:
+    """Return the process-wide `Service` for `name`; keyword arguments apply only when it is first created"""
+    with _services_lock:
+        if name not in _services:
+            rate, capacity = SERVICE_LIMITS.get(name, (10, 10))
+            if os.getenv(f"RATE_LIMIT_{name.upper()}"):
+                rate = capacity = float(os.getenv(f"RATE_LIMIT_{name.upper()}"))
+            kwargs.setdefault("rate", rate)
+            kwargs.setdefault("capacity", capacity)
+            _services[name] = Service(name, **kwargs)
+        return _services[name]
+
+def rate_limit_metrics():
+    """Counters for every service so far, e.g. {"slack": {"calls": 120, "throttled": 3, ...}}"""
+    with _services_lock:
+        services = list(_services.values())
+    snapshot = {}
+    for service in services:
+        with service.metrics_lock:
+            snapshot[service.name] = dict(service.metrics, circuit=service.breaker.state)
+    return snapshot
+
+PLAIN_TYPES = (str, bytes, int, float, bool, dict, list, tuple, type(None))
+
+# Client methods that only read, and so are safe to repeat after a timeout. Anything else
+# (create, update, chat_postMessage, runs.stream, ...) is treated as a write
+READ_METHODS = re.compile(
+    r"^(retrieve|list|get|query|search)|^(conversations_(history|replies|info|list)|users_(info|list)|team_info|auth_test|files_info)$"
+)
+
+def is_read(method_name):
+    return bool(READ_METHODS.match(method_name))
+
+class RateLimitedStream:
+    """Context manager wrapper whose `__enter__` (where streaming requests are sent) is retried"""
+
+    def __init__(self, manager, service: Service, idempotent=True):
+        self._manager = manager
+        self._service = service
+        self._idempotent = idempotent
+
+    def __enter__(self):
+        return self._service.call(self._manager.__enter__, idempotent=self._idempotent)
+
+    def __exit__(self, *exc_info):
+        return self._manager.__exit__(*exc_info)
+
+class RateLimited:
+    """Proxy sending every method call on an API client (and its namespaces) through a `Service`.
+
+    `rate_limited(client, "openai").beta.threads.messages.create(...)` waits on the OpenAI
+    bucket and retries 429s and 5xx; coroutine methods of async clients are awaited in the same way.
+    Writes (methods not matching `READ_METHODS`) are not retried once they may have reached the server.
+    """
+
+    def __init__(self, target, service: Service):
+        self._target = target
+        self._service = service
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        service = self._service
+        idempotent = is_read(name)
+
+        if inspect.iscoroutinefunction(attr):
+            async def call_async(*args, **kwargs):
+                return await service.call_async(attr, *args, idempotent=idempotent, **kwargs)
+            return call_async
+
+        if callable(attr) and not isinstance(attr, type):
+            def call(*args, **kwargs):
+                result = service.call(attr, *args, idempotent=idempotent, **kwargs)
+                if hasattr(result, "__enter__") and hasattr(result, "__exit__"):
+                    return RateLimitedStream(result, service, idempotent)
+                return result
+            return call
+
+        if isinstance(attr, PLAIN_TYPES) or isinstance(attr, type):
+            return attr
+
+        return RateLimited(attr, service)
+
+    def __repr__(self):
+        return f"RateLimited({self._target!r}, {self._service.name!r})"
+
+def rate_limited(client, name):
+    """Wrap `client` so its calls share the rate limit, retries and breaker of service `name`"""
+    if isinstance(client, RateLimited):
+        return client
+    return RateLimited(client, get_service(name))
@@ -0,0 +1,32 @@
+# Script to replay recorded Notion webhook payloads against a local receiver
+import os
+import sys
+import json
+import hmac
+import hashlib
+
+from utils.clients import load_env, http_session
+
+def sign(body: bytes, secret: str) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def replay_webhook_events(path, url="http://localhost:8080", secret=None):
+    """Post each payload in a JSON list or JSON lines file to the receiver, signed like Notion does"""
+    load_env()
+    secret = secret or os.getenv("NOTION_WEBHOOK_SECRET", "")
+
+    with open(path) as f:
+        text = f.read().strip()
+    events = json.loads(text) if text.startswith("[") else [json.loads(line) for line in text.splitlines() if line]
+
+    for event in events:
+        body = json.dumps(event).encode()
+        response = http_session().post(
+            url,
+            data=body,
+            headers={"Content-Type": "application/json", "X-Notion-Signature": sign(body, secret)}
+        )
+        print(f"Replayed {event.get('type')} event {event.get('id')}: {response.status_code}")
+
+if __name__ == "__main__":
+    replay_webhook_events(*sys.argv[1:3])
@@ -0,0 +1,72 @@
+from typing import Callable, List, Dict, Optional
+
+# Run lifecycle events (as opposed to `thread.run.step.*` events, which carry RunSteps)
+RUN_EVENTS = {
+    "thread.run.created",
+    "thread.run.queued",
+    "thread.run.in_progress",
+    "thread.run.requires_action",
+    "thread.run.completed",
+    "thread.run.incomplete",
+    "thread.run.failed",
+    "thread.run.cancelling",
+    "thread.run.cancelled",
+    "thread.run.expired",
+}
+
+def cancel_run(client, thread_id, run, name="Assistant"):
+    """Cancel a run left waiting for tool outputs, so the thread accepts new messages again"""
+    try:
+        client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+        print(f"Cancelled run {run.id} of {name}")
+    except Exception as e:
+        print(f"Error cancelling run {run.id} of {name}: {e}")
+
+def stream_run(client, thread_id, assistant_id,
+               on_requires_action: Optional[Callable[..., List[Dict]]] = None,
+               on_text_delta: Optional[Callable[[str], None]] = None,
+               name="Assistant"):
+    """Run an assistant on a thread and consume its events as they arrive.
+
+    `on_requires_action(run)` is called as soon as the run asks for tool outputs and
+    must return the outputs to submit; the run then resumes on a new stream. If it raises
+    or returns no outputs, the run is cancelled. Returns the last run object seen.
+    """
+    manager = client.beta.threads.runs.stream(
+        thread_id=thread_id,
+        assistant_id=assistant_id
+    )
+
+    run = None
+    while manager is not None:
+        tool_outputs = None
+        with manager as stream:
+            for event in stream:
+                if event.event in RUN_EVENTS:
+                    run = event.data
+                    print(f"Run status for {name}: {run.status}")
+
+                    if run.status == "requires_action" and run.required_action.type == "submit_tool_outputs":
+                        try:
+                            tool_outputs = on_requires_action(run) if on_requires_action else []
+                        except Exception:
+                            cancel_run(client, thread_id, run, name=name)
+                            raise
+
+                elif event.event == "thread.message.delta" and on_text_delta:
+                    for content in event.data.delta.content or []:
+                        if content.type == "text" and content.text and content.text.value:
+                            on_text_delta(content.text.value)
+
+        manager = None
+        if tool_outputs:
+            manager = client.beta.threads.runs.submit_tool_outputs_stream(
+                thread_id=thread_id,
+                run_id=run.id,
+                tool_outputs=tool_outputs
+            )
+        elif run is not None and run.status == "requires_action":
+            print("No tool outputs to submit.")
+            cancel_run(client, thread_id, run, name=name)
+
+    return run
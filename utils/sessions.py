@@ -0,0 +1,115 @@
+import json
+import time
+import sqlite3
+import threading
+
+from typing import Protocol
+from utils.cache import TTLCache
+from utils.state import state_path
+
+_MISSING = object()
+
+class SessionStore(Protocol):
+    """Per-user conversation state (thread ids, histories) keyed by a string"""
+    def get(self, key, default=None):
+        pass
+
+    def set(self, key, value):
+        pass
+
+    def pop(self, key, default=None):
+        pass
+
+class MemorySessionStore:
+    """Bounded in-memory store. The least recently used sessions are forgotten past `maxsize`"""
+
+    def __init__(self, maxsize=10000):
+        self.cache = TTLCache(maxsize=maxsize)
+
+    def get(self, key, default=None):
+        return self.cache.get(key, default)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+    def pop(self, key, default=None):
+        return self.cache.pop(key, default)
+
+class PrefixedSessionStore:
+    """View of another store with every key prefixed, so several kinds of state can share one store"""
+
+    def __init__(self, store: SessionStore, prefix):
+        self.store = store
+        self.prefix = prefix
+
+    def get(self, key, default=None):
+        return self.store.get(f"{self.prefix}{key}", default)
+
+    def set(self, key, value):
+        self.store.set(f"{self.prefix}{key}", value)
+
+    def pop(self, key, default=None):
+        return self.store.pop(f"{self.prefix}{key}", default)
+
+class SQLiteSessionStore:
+    """Persistent store in SQLite with an in-memory LRU front for recently active sessions.
+
+    Values are stored as JSON. Sessions evicted from the front are reloaded from disk on demand,
+    and rows untouched for `ttl` seconds are dropped at startup.
+    """
+
+    def __init__(self, name, path=None, cache_size=1024, ttl=90 * 24 * 60 * 60):
+        self.table = name
+        self.ttl = ttl
+
+        self.front = TTLCache(maxsize=cache_size)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path or state_path("sessions.db"), check_same_thread=False)
+
+        with self.lock, self.db:
+            self.db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.db.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_updated_at ON {self.table} (updated_at)")
+
+        self.compact()
+
+    def get(self, key, default=None):
+        value = self.front.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self.lock:
+            row = self.db.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            return default
+
+        value = json.loads(row[0])
+        self.front.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.front.set(key, value)
+        with self.lock, self.db:
+            self.db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), time.time())
+            )
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self.front.pop(key)
+        with self.lock, self.db:
+            self.db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+        return value
+
+    def compact(self):
+        """Drop sessions untouched for longer than the ttl"""
+        with self.lock, self.db:
+            deleted = self.db.execute(
+                f"DELETE FROM {self.table} WHERE updated_at < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+        if deleted:
+            print(f"Compacted {deleted} sessions from {self.table}")
@@ -0,0 +1,32 @@
+import os
+import json
+import threading
+
+# Local state (watermarks, caches, registries) lives under STATE_DIR
+_lock = threading.Lock()
+
+def state_path(name):
+    """Path of a file in the local state directory"""
+    state_dir = os.getenv("STATE_DIR", ".state")
+    os.makedirs(state_dir, exist_ok=True)
+    return os.path.join(state_dir, name)
+
+def load_json(name, default=None):
+    path = state_path(name)
+    try:
+        with _lock, open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except json.JSONDecodeError as e:
+        print(f"Ignoring corrupt state file {path}: {e}")
+        return default
+
+def save_json(name, data):
+    # Write to a temporary file first so a crash never leaves a partial file behind
+    path = state_path(name)
+    tmp_path = path + ".tmp"
+    with _lock:
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,183 @@
+import io
+import os
+import hashlib
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+from utils.classes import File
+from utils.state import load_json, save_json
+from utils.cache import TTLCache
+from utils.ratelimit import status_code
+
+UPLOADS_FILE = "uploads.json"
+
+def content_hash(file: File) -> str:
+    """SHA-256 of a file's bytes, hashed in place for memory-mapped content"""
+    return hashlib.sha256(file.content).hexdigest()
+
+class MemoryviewReader(io.RawIOBase):
+    """Read-only file object over a buffer, so it can be streamed without copying it into bytes"""
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast("B")
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        chunk = self.view[self.position:self.position + len(b)]
+        b[:len(chunk)] = chunk
+        self.position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = len(self.view) + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+def upload_body(file: File):
+    """The file argument for files.create, streamed from the buffer in place unless it is plain bytes"""
+    if isinstance(file.content, bytes):
+        return file.content
+    return MemoryviewReader(file.content)
+
+class UploadCache:
+    """Maps the SHA-256 of uploaded content to its OpenAI file id.
+
+    With `persist`, the mapping is also kept in the local state directory so it survives restarts.
+    """
+
+    def __init__(self, persist=None):
+        self._persist = persist
+        self.lock = threading.Lock()
+        self._ids: Dict[str, str] = None
+
+        # Remote files confirmed to still exist, so a hit costs at most one check an hour
+        self.verified = TTLCache(maxsize=4096, ttl=60 * 60)
+
+    @property
+    def persist(self) -> bool:
+        # Defaults to the UPLOAD_CACHE_PERSIST setting, read on first use
+        if self._persist is None:
+            self._persist = os.getenv("UPLOAD_CACHE_PERSIST", "true").lower() == "true"
+        return self._persist
+
+    @property
+    def ids(self) -> Dict[str, str]:
+        # Loaded on first use so importing this module has no side effects
+        if self._ids is None:
+            self._ids = load_json(UPLOADS_FILE, default={}) if self.persist else {}
+        return self._ids
+
+    def get(self, digest):
+        with self.lock:
+            return self.ids.get(digest)
+
+    def exists(self, client, file_id) -> bool:
+        """Whether a cached remote file still exists. Files that expired or were deleted are forgotten"""
+        if file_id in self.verified:
+            return True
+
+        try:
+            client.files.retrieve(file_id)
+        except Exception as e:
+            if status_code(e) != 404:
+                raise
+            print(f"Uploaded file {file_id} no longer exists, uploading again")
+            self.forget(file_id)
+            return False
+
+        self.verified.set(file_id, True)
+        return True
+
+    def set(self, digest, file_id):
+        with self.lock:
+            self._reload()
+            self.ids[digest] = file_id
+            self._save()
+
+    def forget(self, file_id):
+        """Invalidate entries pointing at a remote file that was deleted"""
+        self.verified.pop(file_id)
+        with self.lock:
+            self._reload()
+            digests = [digest for digest, cached_id in self.ids.items() if cached_id == file_id]
+            for digest in digests:
+                del self.ids[digest]
+            if digests:
+                self._save()
+
+    def _reload(self):
+        # Another process (e.g. a utils.delete run) may have changed the file since it was loaded
+        if self.persist:
+            self._ids = load_json(UPLOADS_FILE, default={})
+
+    def _save(self):
+        if self.persist:
+            save_json(UPLOADS_FILE, self.ids)
+
+upload_cache = UploadCache()
+
+def upload_file(client, file: File, purpose='assistants', digest=None) -> str:
+    """Upload a file to OpenAI, reusing the remote file if identical content was uploaded before"""
+    digest = digest or content_hash(file)
+    file_id = upload_cache.get(digest)
+    if file_id and upload_cache.exists(client, file_id):
+        print(f"Reusing uploaded file {file_id} for {file.name}")
+        return file_id
+
+    body = upload_body(file)
+    try:
+        uploaded_file = client.files.create(
+            file=body,
+            purpose=purpose
+        )
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+    upload_cache.set(digest, uploaded_file.id)
+    return uploaded_file.id
+
+_upload_pool = None
+_upload_pool_lock = threading.Lock()
+
+def upload_pool() -> ThreadPoolExecutor:
+    global _upload_pool
+    with _upload_pool_lock:
+        if _upload_pool is None:
+            _upload_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv("UPLOAD_WORKERS", 8)),
+                thread_name_prefix="upload"
+            )
+        return _upload_pool
+
+def upload_files(client, files: List[File], purpose='assistants') -> List[str]:
+    """Upload files concurrently on a bounded pool, returning their ids in the original order.
+
+    Files with identical content in the same batch are uploaded once.
+    """
+    if len(files) == 1:
+        return [upload_file(client, files[0], purpose=purpose)]
+
+    digests = list(upload_pool().map(content_hash, files))
+    unique = {}
+    for digest, file in zip(digests, files):
+        unique.setdefault(digest, file)
+
+    file_ids = dict(zip(unique, upload_pool().map(
+        lambda item: upload_file(client, item[1], purpose=purpose, digest=item[0]), unique.items()
+    )))
+    return [file_ids[digest] for digest in digests]